@@ -1,10 +1,21 @@
 # Authors: Devon Callan, Shivani Medhan
 # June 2025
 
+import hashlib
 import os
-from typing import Optional, Dict, Tuple
+import sys
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
+import scipy
+from scipy.integrate import simpson
+
+import ingest
+from result_cache import ResultCache, fingerprint, write_text_if_changed
 
 #################
 ### Constants ###
@@ -18,6 +29,18 @@ CONV_KEY_FORMAT = "Conversion {} [%]"
 CONC_KEY = "Concentration [mol/L]"
 CONV_KEY = "Conversion [%]"
 
+IR_ABS_KEY_FORMAT = "Absorbance [{} cm^-1]"
+IR_AREA_KEY_FORMAT = "Band Area [{} cm^-1]"
+
+NMR_PPM_KEY = "Frequency(ppm)"
+NMR_INTENSITY_KEY = "Intensity"
+NMR_INTEGRAL_KEY_FORMAT = "Integral [{}-{} ppm]"
+
+# Band quantities: height is the maximum over the band (the value itself for
+# a single wavenumber); baseline_area subtracts the straight line between
+# the band edges from the trapezoid area
+IR_METHODS = ["height", "area", "baseline_area"]
+
 UV_VIS_KEY = "UV_Vis"
 IR_KEY = "IR"
 NMR_KEY = "NMR"
@@ -49,7 +72,14 @@ def read_UV_Vis_data(
     wavelength_map: dict = default_wavelength_map,
     init_conc: Optional[float] = 1.0,
     abs_coeff: Optional[float] = None,
+    dtype: Optional[np.dtype] = None,
 ) -> Optional[pd.DataFrame]:
+    """
+    Absorbance, concentration and conversion for each UV-Vis channel.
+
+    All channels are computed at once as one (rows x channels) array. Pass
+    dtype=np.float32 to read and compute the absorbances in single precision.
+    """
 
     data_path = f"{data_dir}/UV-Vis/{sample_name}"
 
@@ -62,51 +92,68 @@ def read_UV_Vis_data(
         print(e)
         return None
 
-    data = pd.read_csv(data_path, delimiter=",", skipinitialspace=True)
-
-    cols = ["Time"] + [f"UV/Vis {i}" for i in wavelength_map.keys()]
-
-    df_extracted = data[cols].copy()
-    df_extracted.columns = [TIME_KEY] + [
-        f"UV-Vis [{w} nm]" for w in wavelength_map.values()
-    ]
-
-    for i, w in wavelength_map.items():
+    uv_cols = [f"UV/Vis {i}" for i in wavelength_map.keys()]
+    data = ingest.read_csv(
+        data_path,
+        delimiter=",",
+        skipinitialspace=True,
+        usecols=["Time"] + uv_cols,
+        dtype=None if dtype is None else {col: dtype for col in uv_cols},
+    )
 
-        conc_key = CONC_KEY_FORMAT.format(i)
-        conv_key = CONV_KEY_FORMAT.format(i)
+    absorbance = data[uv_cols].to_numpy(dtype=dtype)
+    num_rows, num_channels = absorbance.shape
 
-        if abs_coeff is not None:
-            # Calculate concentration using the provided absorbance coefficient
-            df_extracted[conc_key] = df_extracted[f"UV-Vis [{w} nm]"].apply(
-                lambda x: x / abs_coeff if abs_coeff != 0 else 0
-            )
-            df_extracted[conc_key] = df_extracted[conc_key].clip(lower=0)
-            df_extracted[conv_key] = df_extracted[conc_key].apply(
-                lambda x: (1 - (x / init_conc)) * 100 if init_conc != 0 else 0
-            )
+    if abs_coeff is not None:
+        # Calculate concentration using the provided absorbance coefficient
+        if abs_coeff != 0:
+            conc = _clip(absorbance / abs_coeff, lower=0)
         else:
-            # Normalize concentration based on the maximum absorbance at the first time point
-            max_abs = df_extracted[f"UV-Vis [{w} nm]"].iloc[1]
-            df_extracted[conc_key] = df_extracted[f"UV-Vis [{w} nm]"].apply(
-                lambda x: (x / max_abs) * init_conc if max_abs != 0 else 0
-            )
-            df_extracted[conc_key] = df_extracted[conc_key].clip(
-                lower=0, upper=init_conc
-            )
-
-            # Calculate conversion based on the initial concentration
-            df_extracted[conv_key] = df_extracted[conc_key].apply(
-                lambda x: (1 - (x / init_conc)) * 100 if init_conc != 0 else 0
-            )
+            conc = np.zeros((num_rows, num_channels), dtype=np.int64)
+        conc = list(conc.T)
+    else:
+        # Normalize concentration based on the absorbance at the first time point
+        max_abs = absorbance[1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = _clip((absorbance / max_abs) * init_conc, lower=0, upper=init_conc)
+        conc = [
+            scaled[:, j] if max_abs[j] != 0 else np.zeros(num_rows, dtype=np.int64)
+            for j in range(num_channels)
+        ]
+
+    # Calculate conversion based on the initial concentration
+    if init_conc != 0:
+        conv = [(1 - (c / init_conc)) * 100 for c in conc]
+    else:
+        conv = [np.zeros(num_rows, dtype=np.int64) for _ in conc]
+
+    # Shift by the plug flow delay (as apply_time_shift, without the copies)
+    time = data["Time"].to_numpy() - 7
+    keep = time >= 0
+
+    columns = {TIME_KEY: time}
+    for col, w in zip(uv_cols, wavelength_map.values()):
+        columns[f"UV-Vis [{w} nm]"] = data[col].to_numpy()
+    for j, i in enumerate(wavelength_map.keys()):
+        columns[CONC_KEY_FORMAT.format(i)] = conc[j]
+        columns[CONV_KEY_FORMAT.format(i)] = conv[j]
 
     # Adding the highest wavelength as the concentration and conversion keys
-    df_extracted[CONC_KEY] = df_extracted[conc_key]
-    df_extracted[CONV_KEY] = df_extracted[conv_key]
+    columns[CONC_KEY] = conc[-1]
+    columns[CONV_KEY] = conv[-1]
+
+    if keep.all():
+        return pd.DataFrame(columns)
+    return pd.DataFrame({key: values[keep] for key, values in columns.items()})
 
-    df_extracted = apply_time_shift(df_extracted, shift_min=7)
 
-    return df_extracted
+def _clip(values: np.ndarray, lower=None, upper=None) -> np.ndarray:
+    # Same results as Series.clip: NaN and -0.0 pass through unchanged
+    if lower is not None:
+        values = np.where(values < lower, lower, values)
+    if upper is not None:
+        values = np.where(values > upper, upper, values)
+    return values
 
 
 def get_solvent_IR_data(solvent_data_dir: str) -> pd.DataFrame:
@@ -125,16 +172,178 @@ def get_solvent_IR_data(solvent_data_dir: str) -> pd.DataFrame:
     solvent_files = sorted(solvent_files)
     ref_solvent_file = solvent_files[-2]
 
-    return pd.read_csv(ref_solvent_file)
+    return ingest.read_csv(ref_solvent_file)
+
+
+def load_IR_spectra(
+    data_dir: str,
+    sample_name: str,
+    workers: Optional[int] = None,
+    cache: bool = True,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Every IR spectrum of a sample as one (times x wavenumbers) matrix.
+
+    Returns (times_min, wavenumbers, spectra) sorted by time, with spectra[i]
+    measured at times_min[i]. The SPC_ files are parsed in a thread pool the
+    first time; after that the matrix is memory-mapped from a .npy cache.
+    """
+
+    sample_data_dir = f"{data_dir}/IR/{sample_name}"
+    paths = [
+        os.path.join(sample_data_dir, f)
+        for f in sorted(os.listdir(sample_data_dir))
+        if f.endswith(".csv")
+    ]
+
+    def build():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            spectra = list(executor.map(_read_IR_spectrum, paths))
+
+        wavenumbers = spectra[0][1]
+        for path, (_, w, _) in zip(paths, spectra):
+            if not np.array_equal(w, wavenumbers):
+                raise ValueError(f"Wavenumber axis of {path} differs from {paths[0]}.")
+
+        times_min = np.array([convert_time_str_to_min(t) for t, _, _ in spectra])
+        order = np.argsort(times_min, kind="stable")
+        matrix = np.empty((len(spectra), len(wavenumbers)))
+        for row, i in enumerate(order):
+            matrix[row] = spectra[i][2]
+        return {"times_min": times_min[order], "wavenumbers": wavenumbers, "spectra": matrix}
+
+    if cache:
+        arrays = ingest.cached_arrays(sample_data_dir, "IR_spectra", paths, build)
+    else:
+        arrays = build()
+    return arrays["times_min"], arrays["wavenumbers"], arrays["spectra"]
+
+
+def _read_IR_spectrum(path: str) -> Tuple[str, np.ndarray, np.ndarray]:
+    data = pd.read_csv(path)
+    time_str = data.columns[1]  # Second column label is time
+    return time_str, data.iloc[:, 0].to_numpy(), data.iloc[:, 1].to_numpy(dtype=np.float64)
+
+
+def subtract_solvent(spectra: np.ndarray, solvent: np.ndarray) -> np.ndarray:
+    # Ensure no negative values
+    return _clip(spectra - solvent, lower=0)
+
+
+# Most recently used wavenumber axes (a run normally has one)
+_wavenumber_indices: "OrderedDict[tuple, Dict[float, int]]" = OrderedDict()
+_MAX_WAVENUMBER_INDICES = 8
+
+
+def wavenumber_index(wavenumbers: np.ndarray) -> Dict[float, int]:
+    """Column of each wavenumber on an axis. Built once per distinct axis."""
+    wavenumbers = np.ascontiguousarray(wavenumbers)
+    key = (wavenumbers.dtype.str, hashlib.sha1(wavenumbers.tobytes()).hexdigest())
+    if key in _wavenumber_indices:
+        _wavenumber_indices.move_to_end(key)
+        return _wavenumber_indices[key]
+
+    # Reversed so the first occurrence of a repeated value wins
+    index = {w: i for i, w in reversed(list(enumerate(wavenumbers.tolist())))}
+    _wavenumber_indices[key] = index
+    while len(_wavenumber_indices) > _MAX_WAVENUMBER_INDICES:
+        _wavenumber_indices.popitem(last=False)
+    return index
+
+
+def band_columns(wavenumbers: np.ndarray, bands: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    First and last column (inclusive) of each band.
+
+    A band is a single wavenumber or a (low, high) window in cm^-1. Values not
+    on the axis map to the nearest wavenumber; values outside it raise.
+    """
+    index = wavenumber_index(wavenumbers)
+    low_w, high_w = float(np.min(wavenumbers)), float(np.max(wavenumbers))
+
+    def column(value):
+        if value in index:
+            return index[value]
+        if not low_w <= value <= high_w:
+            raise ValueError(f"Wavenumber {value} cm^-1 is outside the IR data ({low_w:g}-{high_w:g} cm^-1).")
+        return int(np.argmin(np.abs(wavenumbers - value)))
+
+    first, last = [], []
+    for band in bands:
+        a, b = (band, band) if np.ndim(band) == 0 else band
+        a, b = column(a), column(b)
+        first.append(min(a, b))
+        last.append(max(a, b))
+    return np.array(first, dtype=np.intp), np.array(last, dtype=np.intp)
+
+
+def quantify_IR_bands(
+    wavenumbers: np.ndarray,
+    spectra: np.ndarray,
+    bands: Sequence,
+    method: str = "height",
+    solvent: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Height or area of every band in every spectrum, as a (times x bands) array.
+
+    Only the columns spanned by the bands are read. All bands are reduced
+    together (one reduceat or one cumulative trapezoid), so many bands cost
+    about as much as one. With solvent, it is subtracted first (clipped at 0).
+    """
+    if method not in IR_METHODS:
+        raise ValueError(f"Invalid IR method: {method}. Must be one of {IR_METHODS}.")
+
+    first, last = band_columns(wavenumbers, bands)
+    if method != "height" and np.any(first == last):
+        band = bands[int(np.flatnonzero(first == last)[0])]
+        raise ValueError(f"Method {method} needs a (low, high) window wider than one point, got {band}.")
+    start, stop = int(first.min()), int(last.max()) + 1
+    window = np.asarray(spectra[:, start:stop], dtype=np.float64)
+    if solvent is not None:
+        window = subtract_solvent(window, solvent[start:stop])
+    first, last = first - start, last - start
+
+    if method == "height":
+        # Even reduceat segments are [first, last + 1); the repeated end column
+        # keeps last + 1 a valid index
+        window = np.concatenate([window, window[:, -1:]], axis=1)
+        edges = np.column_stack([first, last + 1]).ravel()
+        return np.maximum.reduceat(window, edges, axis=1)[:, ::2]
+
+    axis = np.asarray(wavenumbers[start:stop], dtype=np.float64)
+    cumulative = np.zeros(window.shape)
+    np.cumsum((window[:, 1:] + window[:, :-1]) / 2 * np.abs(np.diff(axis)), axis=1, out=cumulative[:, 1:])
+    area = cumulative[:, last] - cumulative[:, first]
+    if method == "baseline_area":
+        width = np.abs(axis[last] - axis[first])
+        area = area - (window[:, first] + window[:, last]) / 2 * width
+    return area
+
+
+def _band_key(band, method: str) -> str:
+    position = f"{band}" if np.ndim(band) == 0 else f"{band[0]}-{band[1]}"
+    key_format = IR_ABS_KEY_FORMAT if method == "height" else IR_AREA_KEY_FORMAT
+    return key_format.format(position)
 
 
 def read_IR_data(
     data_dir: str,
     sample_name: str,
     cutoff_time_min: Optional[int] = None,
-    wavenumber: int = 1620,
+    wavenumber=1620,
     abs_coeff: float = 1.0,
+    bands: Sequence = (),
+    method: str = "height",
 ) -> Optional[pd.DataFrame]:
+    """
+    Absorbance, concentration and conversion of the band at wavenumber.
+
+    wavenumber may also be a (low, high) window, and must be one for the
+    area methods (a single wavenumber has no area). bands are reference bands
+    (wavenumbers or windows) reported as extra columns; all bands are
+    quantified together with quantify_IR_bands.
+    """
 
     sample_data_dir = f"{data_dir}/IR/{sample_name}"
     solvent_data_dir = f"{data_dir}/IR/THF"
@@ -153,8 +362,7 @@ def read_IR_data(
 
         solvent_data = get_solvent_IR_data(solvent_data_dir)
 
-        sample_data_files = os.listdir(sample_data_dir)
-        if not sample_data_files:
+        if not any(f.endswith(".csv") for f in os.listdir(sample_data_dir)):
             raise FileNotFoundError(
                 f"No sample IR data files found in: {sample_data_dir}"
             )
@@ -162,59 +370,164 @@ def read_IR_data(
         print(e)
         return None
 
-    # Loop through sample data files at each time
-    data_list = []
-    for data_file in sample_data_files:
+    times_min, wavenumbers, spectra = load_IR_spectra(data_dir, sample_name)
+    solvent = solvent_data.iloc[:, 1].to_numpy()
+    if solvent.shape[0] != wavenumbers.shape[0]:
+        raise ValueError("Solvent and sample IR spectra have different lengths.")
 
-        if not data_file.endswith(".csv"):
-            continue
+    if cutoff_time_min is not None:
+        keep = times_min <= cutoff_time_min
+        times_min, spectra = times_min[keep], spectra[keep]
 
-        # Load the sample data for a specified time
-        sample_data_path = os.path.join(sample_data_dir, data_file)
-        sample_data = pd.read_csv(sample_data_path)
+    # Quantify the monomer band and the reference bands in one pass
+    all_bands = [wavenumber, *bands]
+    values = quantify_IR_bands(wavenumbers, spectra, all_bands, method, solvent)
+    abs_vals = values[:, 0]
+    conc_vals = abs_vals / abs_coeff
 
-        # Extract the time from the data
-        time_str = sample_data.columns[1]  # Second column label is time
-        time_min = convert_time_str_to_min(time_str)
+    # Create a DataFrame from the collected data
+    columns = {TIME_KEY: times_min}
+    for i, band in enumerate(all_bands):
+        columns[_band_key(band, method)] = values[:, i]
+    columns[CONC_KEY] = conc_vals
+    output_data = pd.DataFrame(columns)
 
-        if cutoff_time_min is not None and time_min > cutoff_time_min:
-            continue
+    # Calculate conversion from
+    init_conc = conc_vals[0]
+    if np.any(conc_vals != 0):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            conv = np.where(conc_vals != 0, (1 - (conc_vals / init_conc)) * 100, 0.0)
+    else:
+        conv = np.zeros(len(conc_vals), dtype=np.int64)
+    output_data[CONV_KEY] = conv
 
-        # Subtract the solvent data from the sample data
-        sample_data.iloc[:, 1] = sample_data.iloc[:, 1] - solvent_data.iloc[:, 1]
-        sample_data.iloc[:, 1] = sample_data.iloc[:, 1].clip(
-            lower=0
-        )  # Ensure no negative values
+    output_data = apply_time_shift(output_data, shift_min=7)
 
-        # Get the absorbance value at the specified wavenumber
-        if wavenumber not in sample_data["Wavenumbercm-1"].values:
-            raise ValueError(
-                f"Wavenumber {wavenumber} cm^-1 not found in the sample data."
-            )
-        abs_val = sample_data[sample_data["Wavenumbercm-1"] == wavenumber].iloc[0, 1]
-        conc_val = abs_val / abs_coeff
+    return output_data
 
-        # Add time, absorbance, and concentration to the data list
-        data_list.append([time_min, abs_val, conc_val])
 
-    # Create a DataFrame from the collected data
-    output_data = pd.DataFrame(
-        data_list, columns=[TIME_KEY, f"Absorbance [{wavenumber} cm^-1]", CONC_KEY]
-    ).sort_values(by=TIME_KEY)
+def read_NMR_data(
+    data_dir: str,
+    sample_name: str,
+    total_range_ppm: Tuple[float, float] = (0, 1.3),
+    vinyl_range_ppm: Tuple[float, float] = (0, 0.165),
+    reference_intensity: float = 0.4,
+    init_conc: float = 1.0,
+    shift_min: float = 0,
+    workers: Optional[int] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Conversion from benchtop NMR spectra (the NMR_code_Jan.py workflow).
 
-    # Calculate conversion from
-    init_conc = output_data.iloc[0][CONC_KEY]
-    output_data[CONV_KEY] = output_data[CONC_KEY].apply(
-        lambda x: (1 - (x / init_conc)) * 100 if x != 0 else 0
+    Spectra are read from <data_dir>/NMR/<sample_name>.zip or from the
+    directory <data_dir>/NMR/<sample_name>, one folder per spectrum named
+    ...-HHMMSS, without extracting or writing anything. Each spectrum is
+    referenced to its first point with Intensity > reference_intensity.
+    The total and vinyl ranges are integrated (Simpson), and conversion is
+    (1 - 4 * vinyl / total) * 100. Times are relative to the first spectrum.
+    Spectra without a reference peak are skipped (and reported).
+    """
+
+    zip_path = f"{data_dir}/NMR/{sample_name}.zip"
+    sample_data_dir = f"{data_dir}/NMR/{sample_name}"
+
+    try:
+        if not os.path.exists(data_dir):
+            raise FileNotFoundError(f"Data directory not found: {data_dir}")
+        elif not os.path.exists(zip_path) and not os.path.exists(sample_data_dir):
+            raise FileNotFoundError(f"NMR data file not found: {zip_path}")
+        spectra = _read_NMR_sources(zip_path if os.path.exists(zip_path) else sample_data_dir)
+        if not spectra:
+            raise FileNotFoundError(f"No NMR spectra found in: {sample_data_dir}")
+    except FileNotFoundError as e:
+        print(e)
+        return None
+
+    # One spectrum per time stamp; files sort by time of day (HHMMSS)
+    time_stamps = sorted(spectra)
+
+    def integrate(time_stamp):
+        return _integrate_NMR_spectrum(
+            spectra[time_stamp], total_range_ppm, vinyl_range_ppm, reference_intensity
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(integrate, time_stamps))
+
+    times_min = np.array([int(t[:2]) * 60 + int(t[2:4]) + int(t[4:6]) / 60 for t in time_stamps])
+    times_min = times_min - times_min[0]
+
+    skipped = [t for t, result in zip(time_stamps, results) if result is None]
+    if skipped:
+        print(f"Skipped NMR spectra without a peak above {reference_intensity}: {', '.join(skipped)}")
+    keep = np.array([result is not None for result in results])
+    integrals = np.array([result for result in results if result is not None], dtype=np.float64).reshape(-1, 2)
+    total, vinyl = integrals[:, 0], integrals[:, 1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining = 4 * (vinyl / total)
+
+    output_data = pd.DataFrame(
+        {
+            TIME_KEY: times_min[keep],
+            NMR_INTEGRAL_KEY_FORMAT.format(*total_range_ppm): total,
+            NMR_INTEGRAL_KEY_FORMAT.format(*vinyl_range_ppm): vinyl,
+            CONC_KEY: remaining * init_conc,
+            CONV_KEY: (1 - remaining) * 100,
+        }
     )
 
-    output_data = apply_time_shift(output_data, shift_min=7)
+    if shift_min:
+        output_data = apply_time_shift(output_data, shift_min=shift_min)
 
     return output_data
 
 
-def read_NMR_data(data_dir: str, sample_name: str, **kwargs) -> Optional[pd.DataFrame]:
-    return None
+def _read_NMR_sources(path: str) -> Dict[str, bytes]:
+    # Raw CSV bytes by the time stamp of their folder (last "-" part of its
+    # name); CSV files outside a spectrum folder are ignored
+    spectra = {}
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = sorted(n for n in archive.namelist() if n.endswith(".csv"))
+            for name in names:
+                folder = name.rstrip("/").split("/")[:-1]
+                if folder:
+                    spectra[folder[-1].split("-")[-1]] = archive.read(name)
+    else:
+        for folder in sorted(os.listdir(path)):
+            folder_path = os.path.join(path, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in sorted(os.listdir(folder_path)):
+                if name.endswith(".csv"):
+                    with open(os.path.join(folder_path, name), "rb") as f:
+                        spectra[folder.split("-")[-1]] = f.read()
+    return spectra
+
+
+def _integrate_NMR_spectrum(
+    raw: bytes,
+    total_range_ppm: Tuple[float, float],
+    vinyl_range_ppm: Tuple[float, float],
+    reference_intensity: float,
+) -> Optional[Tuple[float, float]]:
+    # None if the spectrum has no peak to reference it to
+    data = ingest.read_csv_bytes(raw, usecols=[NMR_PPM_KEY, NMR_INTENSITY_KEY])
+    ppm = data[NMR_PPM_KEY].to_numpy(dtype=np.float64)
+    intensity = data[NMR_INTENSITY_KEY].to_numpy(dtype=np.float64)
+
+    # Reference the shifts to the first strong peak
+    above = np.flatnonzero(intensity > reference_intensity)
+    if len(above) == 0:
+        return None
+    ppm = ppm - ppm[above[0]]
+
+    integrals = []
+    for low, high in (total_range_ppm, vinyl_range_ppm):
+        in_range = (ppm >= low) & (ppm <= high)
+        integrals.append(simpson(y=intensity[in_range], x=ppm[in_range]))
+    return integrals[0], integrals[1]
 
 
 #################################
@@ -254,36 +567,99 @@ def process_all_data(
     uv_kwargs: Optional[dict] = None,
     ir_kwargs: Optional[dict] = None,
     nmr_kwargs: Optional[dict] = None,
+    use_cache: bool = True,
+    hash_contents: bool = False,
 ) -> Dict[str, pd.DataFrame]:
+    """Reads every instrument and saves the results to <data_dir>/Processed.
+
+    With use_cache, each reader's result is memoized under its input files,
+    kwargs and the reader code (see result_cache.py), and CSV files are only
+    rewritten when their content changes. hash_contents keys inputs by
+    content instead of size and mtime."""
+    readers = {
+        UV_VIS_KEY: (read_UV_Vis_data, uv_kwargs),
+        IR_KEY: (read_IR_data, ir_kwargs),
+        NMR_KEY: (read_NMR_data, nmr_kwargs),
+    }
+    inputs = _reader_inputs(data_dir, sample_name)
+    cache = get_result_cache(os.path.join(data_dir, "Processed")) if use_cache else None
 
     # Read data from the specified directories
-    uv_data = read_UV_Vis_data(data_dir, sample_name, **(uv_kwargs or {}))
-    ir_data = read_IR_data(data_dir, sample_name, **(ir_kwargs or {}))
-    nmr_data = read_NMR_data(data_dir, sample_name, **(nmr_kwargs or {}))
+    data_dict, keys = {}, {}
+    for instrument, (reader, kwargs) in readers.items():
+        kwargs = kwargs or {}
+        if cache is None:
+            data_dict[instrument] = reader(data_dir, sample_name, **kwargs)
+            continue
+        keys[instrument] = cache.key(
+            instrument,
+            sample_name,
+            _reader_version(),
+            sorted((name, repr(value)) for name, value in kwargs.items()),
+            fingerprint(inputs[instrument], hash_contents),
+        )
+        hit, data = cache.get(keys[instrument])
+        if not hit:
+            data = reader(data_dir, sample_name, **kwargs)
+            # Missing data is not cached, so the reader reports it every run
+            if data is not None:
+                cache.put(keys[instrument], data)
+        # Deep copy: a shallow one shares the value buffers, so in place edits
+        # by the caller would change the cached frame
+        data_dict[instrument] = data.copy() if data is not None else None
 
     # Create directories for processed data and figures
     process_dir, figures_dir = create_output_dir(data_dir, sample_name)
 
     # Save processed data to CSV files
-    if uv_data is not None:
-        uv_path = os.path.join(process_dir, f"{sample_name}_{UV_VIS_KEY}.csv")
-        uv_data.to_csv(uv_path, index=False)
-    if ir_data is not None:
-        ir_path = os.path.join(process_dir, f"{sample_name}_{IR_KEY}.csv")
-        ir_data.to_csv(ir_path, index=False)
-    if nmr_data is not None:
-        nmr_path = os.path.join(process_dir, f"{sample_name}_{NMR_KEY}.csv")
-        nmr_data.to_csv(nmr_path, index=False)
-
-    data_dict = {
-        UV_VIS_KEY: uv_data,
-        IR_KEY: ir_data,
-        NMR_KEY: nmr_data,
-    }
+    for instrument, data in data_dict.items():
+        if data is None:
+            continue
+        path = os.path.join(process_dir, f"{sample_name}_{instrument}.csv")
+        if cache is None:
+            write_text_if_changed(path, data.to_csv(index=False))
+        else:
+            cache.write_if_changed(path, keys[instrument], lambda: data.to_csv(index=False))
 
     return data_dict
 
 
+_result_caches: Dict[str, ResultCache] = {}
+_source_digest = None
+
+
+def get_result_cache(process_dir: str) -> ResultCache:
+    """The ResultCache of a Processed directory (one per directory and process)."""
+    directory = os.path.abspath(os.path.join(process_dir, ".cache"))
+    if directory not in _result_caches:
+        _result_caches[directory] = ResultCache(directory)
+    return _result_caches[directory]
+
+
+def _reader_inputs(data_dir: str, sample_name: str) -> Dict[str, list]:
+    # Files each reader depends on
+    return {
+        UV_VIS_KEY: [os.path.join(data_dir, "UV-Vis", sample_name)],
+        IR_KEY: [os.path.join(data_dir, "IR", sample_name), os.path.join(data_dir, "IR", "THF")],
+        NMR_KEY: [os.path.join(data_dir, "NMR", sample_name), os.path.join(data_dir, "NMR", f"{sample_name}.zip")],
+    }
+
+
+def _reader_version() -> str:
+    # The readers and their helpers live in this module and ingest.py, so a
+    # change to either source invalidates cached results. So does a Python,
+    # NumPy, pandas or SciPy upgrade, which can change results or the pickles.
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha1()
+        digest.update(f"{sys.version}|{np.__version__}|{pd.__version__}|{scipy.__version__}".encode())
+        for path in (__file__, ingest.__file__):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
 ##################################
 ### Plotting Utility Functions ###
 ##################################
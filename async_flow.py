@@ -0,0 +1,304 @@
+"""
+Asyncio transport and interface for the Vapourtec R2/R4.
+
+Each serial port gets one reader task that splits the incoming byte stream
+into lines and hands them to the commands waiting on that port in the order
+they were written. Because nothing blocks the event loop, the R4 (COM4) and
+the R2S (COM5) can be commanded and polled at the same time.
+
+    async with AsyncR2Interface("R2S") as r2s, AsyncR2Interface("R2") as r4:
+        await asyncio.gather(r2s.set_flowrate(0, 1000), r4.set_temp(3, 50))
+
+BlockingR2Interface wraps the same machinery for scripts that are not
+written with asyncio.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flow import SystemStatus, get_serial_port, open_serial
+
+class _LateResponse:
+    """Stands in the response FIFO for a command that timed out or was
+    cancelled. Its answer may still arrive; it is read and thrown away so
+    later responses stay matched to their commands. Past `expires` (loop
+    time) the answer is presumed lost and the placeholder is skipped."""
+
+    __slots__ = ("expires",)
+
+    def __init__(self, expires):
+        self.expires = expires
+
+class AsyncSerialTransport:
+    """Line based request/response transport over a serial port.
+
+    Commands are terminated with a carriage return, responses with a newline.
+    The Vapourtec answers commands in the order it receives them, so responses
+    are matched to in-flight commands first in, first out."""
+
+    # Read timeout of the underlying port. Only bounds how long close() waits
+    # for the reader thread, not how long a command waits for its response.
+    poll_interval = 0.05
+
+    def __init__(self, port, timeout=2.0):
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+        self.failure = None         # exception that ended the reader, e.g. device unplugged
+
+        self._pending = deque()
+        self._write_lock = None
+        self._reader_task = None
+        self._executor = None
+        self._buffer = bytearray()
+
+    @property
+    def is_open(self):
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+
+        # One thread for the blocking reads, one for writes
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"serial-{self.port}")
+        self.connection = await loop.run_in_executor(self._executor, open_serial, self.port, self.poll_interval)
+        self.failure = None
+        self._write_lock = asyncio.Lock()
+        self._reader_task = loop.create_task(self._read_loop())
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+        while self._pending:
+            future = self._pending.popleft()
+            if isinstance(future, asyncio.Future) and not future.done():
+                future.set_exception(ConnectionError(f"{self.port} closed"))
+
+        if self.connection is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.connection.close)
+            self.connection = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def send(self, command, timeout=None):
+        """Sends a command and waits for its response.
+
+        Several commands may be in flight at once; each caller gets the
+        response that belongs to its own command. Raises TimeoutError if no
+        response arrives within the timeout, ConnectionError if the port
+        is closed or reading from it failed."""
+
+        if self.failure is not None:
+            raise self._connection_error()
+        if not self.is_open:
+            raise ConnectionError(f"{self.port} is not open")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        command_bytes = (command + "\r").encode("ascii")
+        timeout = timeout if timeout is not None else self.timeout
+
+        async with self._write_lock:
+            self._pending.append(future)
+            try:
+                await loop.run_in_executor(self._executor, self.connection.write, command_bytes)
+            except BaseException:
+                self._pending.remove(future)
+                raise
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future, loop.time() + timeout)
+            raise TimeoutError(f"No response to {command!r} from {self.port}")
+        except asyncio.CancelledError:
+            self._abandon(future, loop.time() + timeout)
+            raise
+
+    def _abandon(self, future, expires):
+        # Keep the command's slot so a late answer is consumed by it rather
+        # than handed to the next command in flight
+        try:
+            self._pending[self._pending.index(future)] = _LateResponse(expires)
+        except ValueError:
+            pass
+
+    async def _read_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                data = await loop.run_in_executor(self._executor, self._read_chunk)
+                if not data:
+                    continue
+                self._buffer += data
+
+                while True:
+                    end = self._buffer.find(b"\n")
+                    if end < 0:
+                        break
+                    line = bytes(self._buffer[:end])
+                    del self._buffer[:end + 1]
+                    self._dispatch(line.decode("ascii", errors="replace").strip())
+        except Exception as e:
+            # Nothing will answer the commands in flight: fail them now
+            # instead of letting each one run into its timeout
+            self.failure = e
+            while self._pending:
+                future = self._pending.popleft()
+                if isinstance(future, asyncio.Future) and not future.done():
+                    future.set_exception(self._connection_error())
+
+    def _connection_error(self):
+        error = ConnectionError(f"Reading from {self.port} failed: {self.failure!r}")
+        error.__cause__ = self.failure
+        return error
+
+    def _read_chunk(self):
+        return self.connection.read(max(1, self.connection.in_waiting))
+
+    def _dispatch(self, response):
+        now = asyncio.get_running_loop().time()
+        while self._pending:
+            entry = self._pending.popleft()
+            if isinstance(entry, _LateResponse):
+                if entry.expires < now:
+                    continue        # answer presumed lost
+                return              # late answer to an abandoned command
+            if not entry.done():
+                entry.set_result(response)
+                return
+        # Unsolicited line
+
+class AsyncR2Interface:
+
+    def __init__(self, module="R2S", port=None, timeout=2.0):
+        serial_port = port if port is not None else get_serial_port(module)
+        self.transport = AsyncSerialTransport(serial_port, timeout=timeout)
+
+    async def open(self):
+        await self.transport.open()
+        return self
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _send(self, command):
+        return await self.transport.send(command)
+
+    async def start(self):
+        """Powers on pumps and heaters."""
+        return await self._send("PN")
+
+    async def stop(self):
+        """Powers off pumps and heaters."""
+        return await self._send("PF")
+
+    async def set_flowrate(self, pump_id, flow_rate):
+        """Sets the flow rate of a pump in uL/min."""
+        return await self._send(f"FR {pump_id} {flow_rate}")
+
+    async def switch_valve(self, valve_id):
+        """Switches a valve.
+        0 and 1 = first valve (R/S, A pump)
+        2 and 3 = second valve (R/S, B pump)
+        4 and 5 = third valve (top inj.)
+        6 and 7 = fourth valve (bottom inj.)
+        8 and 9 = fifth valve (waste/collection)"""
+        return await self._send(f"KP {valve_id}")
+
+    async def set_temp(self, channel, target):
+        return await self._send(f"R4 ST {channel} {target}")
+
+    async def get_status(self) -> SystemStatus:
+        response = await self._send("GA")
+        status = SystemStatus(response)
+        if not status.is_valid():
+            return {"error": "Invalid status data"}
+        return status
+
+class _LoopThread:
+    """Event loop running in a daemon thread, shared by all blocking interfaces."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-flow", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+class BlockingR2Interface:
+    """Drop-in replacement for flow.R2Interface backed by AsyncR2Interface.
+
+    Every instance shares one background event loop, so two instances used
+    from different threads no longer serialize behind each other."""
+
+    def __init__(self, module="R2S", port=None, timeout=2.0):
+        self._runner = _LoopThread.get()
+        self.interface = AsyncR2Interface(module=module, port=port, timeout=timeout)
+        self._runner.run(self.interface.open())
+
+    def close(self):
+        self._runner.run(self.interface.close())
+
+    def _send(self, command):
+        return self._runner.run(self.interface._send(command))
+
+    def start(self):
+        return self._runner.run(self.interface.start())
+
+    def stop(self):
+        return self._runner.run(self.interface.stop())
+
+    def set_flowrate(self, pump_id, flow_rate):
+        return self._runner.run(self.interface.set_flowrate(pump_id, flow_rate))
+
+    def switch_valve(self, valve_id):
+        return self._runner.run(self.interface.switch_valve(valve_id))
+
+    def set_temp(self, channel, target):
+        return self._runner.run(self.interface.set_temp(channel, target))
+
+    def get_status(self) -> SystemStatus:
+        return self._runner.run(self.interface.get_status())
+
+
+if __name__ == "__main__":
+
+    async def main():
+        async with AsyncR2Interface("R2S") as r2s, AsyncR2Interface("R2") as r4:
+            await asyncio.gather(
+                r2s.switch_valve(1),
+                r4.set_temp(2, 50),
+            )
+            statuses = await asyncio.gather(r2s.get_status(), r4.get_status())
+            for status in statuses:
+                print(status)
+
+    asyncio.run(main())
@@ -0,0 +1,341 @@
+"""
+Round-trip latency benchmarks for the serial control stack.
+
+Every workload runs against simulator.VirtualR2R4, so no reactor is needed.
+Results are printed as a table and written as JSON; pass --compare with an
+older results file to flag commands that got slower.
+
+    python benchmark.py --latency 0.002 --baudrate 19200 --output bench.json
+    python benchmark.py --compare bench.json
+
+Workloads:
+    single      one command at a time through each interface
+    pipelined   --depth commands in flight on one device (AsyncR2Interface)
+    multi       the same commands sent to two devices at once
+    pollers     --pollers tasks polling GA on one device concurrently
+    interlock   reaction to injected overpressure while a script keeps sending FR
+    uv_vis      analysis.read_UV_Vis_data on the Example Data run and on a
+                synthetic log --scale times longer (ms per file)
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import transport
+import vapourtec
+from async_flow import AsyncR2Interface
+from flow import InterlockError, R2Interface
+from interlock import Interlock, RunStateRule
+from monitor import SystemMonitor
+from simulator import PUMP_A_OVERPRESSURE, VirtualR2R4
+
+COMMANDS = {
+    "GA": "GA",
+    "FR": "FR 0 1000",
+    "KP": "KP 1",
+    "R4 ST": "R4 ST 3 50",
+}
+
+def load_new_code_interface():
+    """new_code/flow.py shares its module name with flow.py, so load it by path."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "new_code", "flow.py")
+    spec = importlib.util.spec_from_file_location("new_code_flow", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.R2Interface
+
+def summarize(workload, interface, command, latencies_s, elapsed_s):
+    latencies_ms = np.asarray(latencies_s) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "workload": workload,
+        "interface": interface,
+        "command": command,
+        "n": len(latencies_ms),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "commands_per_s": len(latencies_ms) / elapsed_s if elapsed_s > 0 else float("inf"),
+    }
+
+#################
+### Workloads ###
+#################
+
+def sync_interfaces():
+    """Interface name -> factory returning (send, close) for a port."""
+    NewCodeR2Interface = load_new_code_interface()
+
+    def flow_interface(port):
+        r2 = R2Interface(port=port)
+        return r2._send, r2.connection.close
+
+    def new_code_interface(port):
+        r2 = NewCodeR2Interface(port)
+        return r2.send_command, r2.connection.close
+
+    def vapourtec_interface(port, framed=True):
+        r2 = vapourtec.R2R4(transport.serial(port, framed=framed))
+        return r2._send, r2.transport.close
+
+    return {
+        "flow.R2Interface": flow_interface,
+        "new_code.R2Interface": new_code_interface,
+        "vapourtec.R2R4": vapourtec_interface,
+        "vapourtec.R2R4 (unframed)": lambda port: vapourtec_interface(port, framed=False),
+    }
+
+def bench_single(sim_kwargs, n):
+    """Blocking round trips through each synchronous interface."""
+    results = []
+    for name, make in sync_interfaces().items():
+        with VirtualR2R4(**sim_kwargs) as sim:
+            send, close = make(sim.port)
+            for label, command in COMMANDS.items():
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(n):
+                    t = time.perf_counter()
+                    send(command)
+                    latencies.append(time.perf_counter() - t)
+                results.append(summarize("single", name, label, latencies, time.perf_counter() - start))
+            close()
+    return results
+
+async def _timed(coro, latencies):
+    t = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - t)
+
+async def _bench_pipelined(sim_kwargs, n, depth):
+    results = []
+    with VirtualR2R4(**sim_kwargs) as sim:
+        async with AsyncR2Interface(port=sim.port) as r2:
+            for label, command in COMMANDS.items():
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(0, n, depth):
+                    await asyncio.gather(*(_timed(r2._send(command), latencies) for _ in range(depth)))
+                results.append(summarize(f"pipelined x{depth}", "AsyncR2Interface", label, latencies, time.perf_counter() - start))
+    return results
+
+async def _bench_multi(sim_kwargs, n):
+    results = []
+    with VirtualR2R4(**sim_kwargs) as sim_a, VirtualR2R4(**sim_kwargs) as sim_b:
+        async with AsyncR2Interface(port=sim_a.port) as r2s, AsyncR2Interface(port=sim_b.port) as r4:
+
+            async def run(interface, command, latencies):
+                for _ in range(n):
+                    await _timed(interface._send(command), latencies)
+
+            for label, command in COMMANDS.items():
+                latencies = []
+                start = time.perf_counter()
+                await asyncio.gather(run(r2s, command, latencies), run(r4, command, latencies))
+                results.append(summarize("multi x2", "AsyncR2Interface", label, latencies, time.perf_counter() - start))
+    return results
+
+async def _bench_pollers(sim_kwargs, n, pollers):
+    with VirtualR2R4(**sim_kwargs) as sim:
+        async with AsyncR2Interface(port=sim.port) as r2:
+            latencies = []
+
+            async def poll():
+                for _ in range(max(1, n // pollers)):
+                    await _timed(r2.get_status(), latencies)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(poll() for _ in range(pollers)))
+            return [summarize(f"pollers x{pollers}", "AsyncR2Interface", "GA", latencies, time.perf_counter() - start)]
+
+def bench_interlock(sim_kwargs, trips, poll_hz=20):
+    """Interlock reaction while another thread sends FR commands back to back.
+
+    Reports detection -> PF acknowledged, and injected fault -> PF acknowledged
+    (which adds up to one poll period)."""
+    with VirtualR2R4(**sim_kwargs) as sim:
+        r2 = R2Interface(port=sim.port)
+        r2.start()
+        interlock = Interlock(r2, [RunStateRule()])
+        monitor = SystemMonitor(r2, rate_hz=poll_hz)
+        monitor.add_listener(interlock.on_sample)
+
+        stop = threading.Event()
+
+        def load():
+            i = 0
+            while not stop.is_set():
+                try:
+                    r2.set_flowrate(0, i % 1000)
+                except InterlockError:
+                    time.sleep(0.001)
+                i += 1
+
+        fault_to_action = []
+        loader = threading.Thread(target=load, daemon=True)
+        start = time.perf_counter()
+        with monitor:
+            loader.start()
+            for _ in range(trips):
+                injected = time.perf_counter()
+                sim.model.inject_fault(PUMP_A_OVERPRESSURE)
+                while interlock.tripped is None:
+                    time.sleep(0.0005)
+                fault_to_action.append(time.perf_counter() - injected)
+
+                sim.model.clear_fault()
+                interlock.reset()
+                r2.start()
+                time.sleep(1.0 / poll_hz)
+            stop.set()
+            loader.join()
+        elapsed = time.perf_counter() - start
+        r2.connection.close()
+
+    return [
+        summarize(f"interlock {poll_hz} Hz", "Interlock", "detect", list(interlock.latencies), elapsed),
+        summarize(f"interlock {poll_hz} Hz", "Interlock", "fault", fault_to_action, elapsed),
+    ]
+
+EXAMPLE_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Example Data", "113 - 1.5M (9% LpOH 91% Acrylamide) 50 C"
+)
+EXAMPLE_UV_VIS_SAMPLE = "KJ113"
+
+def write_synthetic_uv_vis(data_dir, sample_name, scale):
+    """Writes the example UV-Vis log repeated `scale` times, with the time
+    axis continued, as data_dir/UV-Vis/sample_name."""
+    import pandas as pd
+
+    data = pd.read_csv(os.path.join(EXAMPLE_DATA_DIR, "UV-Vis", EXAMPLE_UV_VIS_SAMPLE))
+    step = data["Time"].iloc[-1] + (data["Time"].iloc[-1] - data["Time"].iloc[-2])
+    repeats = []
+    for i in range(scale):
+        repeat = data.copy()
+        repeat["Time"] = (repeat["Time"] + i * step).round(3)
+        repeats.append(repeat)
+    os.makedirs(os.path.join(data_dir, "UV-Vis"), exist_ok=True)
+    pd.concat(repeats).to_csv(os.path.join(data_dir, "UV-Vis", sample_name), index=False)
+
+def bench_uv_vis(n, scale=100):
+    """read_UV_Vis_data on the example run (n reads) and on a synthetic
+    log `scale` times longer (fewer reads), with float64 and float32."""
+    from analysis import read_UV_Vis_data
+
+    variants = {
+        "read_UV_Vis_data": {},
+        "read_UV_Vis_data (float32)": {"dtype": np.float32},
+    }
+
+    results = []
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        write_synthetic_uv_vis(synthetic_dir, EXAMPLE_UV_VIS_SAMPLE, scale)
+        runs = [("x1", EXAMPLE_DATA_DIR, max(1, n // 10)), (f"x{scale}", synthetic_dir, max(1, n // 100))]
+        for label, data_dir, reads in runs:
+            for name, kwargs in variants.items():
+                latencies = []
+                start = time.perf_counter()
+                for _ in range(reads):
+                    t = time.perf_counter()
+                    read_UV_Vis_data(data_dir, EXAMPLE_UV_VIS_SAMPLE, **kwargs)
+                    latencies.append(time.perf_counter() - t)
+                results.append(summarize("uv_vis", name, label, latencies, time.perf_counter() - start))
+    return results
+
+def run_benchmarks(workloads, sim_kwargs, n, depth, pollers, scale=100):
+    results = []
+    if "single" in workloads:
+        results += bench_single(sim_kwargs, n)
+    if "pipelined" in workloads:
+        results += asyncio.run(_bench_pipelined(sim_kwargs, n, depth))
+    if "multi" in workloads:
+        results += asyncio.run(_bench_multi(sim_kwargs, n))
+    if "pollers" in workloads:
+        results += asyncio.run(_bench_pollers(sim_kwargs, n, pollers))
+    if "interlock" in workloads:
+        results += bench_interlock(sim_kwargs, max(1, n // 10))
+    if "uv_vis" in workloads:
+        results += bench_uv_vis(n, scale)
+    return results
+
+###############
+### Reports ###
+###############
+
+def _key(result):
+    return (result["workload"], result["interface"], result["command"])
+
+def print_results(results, baseline=None, threshold=0.2):
+    """Prints a table; with a baseline, marks p50 changes larger than threshold."""
+    previous = {_key(r): r for r in baseline["results"]} if baseline else {}
+    header = f"{'workload':<16} {'interface':<27} {'cmd':<6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cmd/s':>9}"
+    print(header)
+    print("-" * len(header))
+
+    regressions = []
+    for r in results:
+        line = (
+            f"{r['workload']:<16} {r['interface']:<27} {r['command']:<6} "
+            f"{r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['commands_per_s']:>9.0f}"
+        )
+        old = previous.get(_key(r))
+        if old is not None and old["p50_ms"] > 0:
+            change = r["p50_ms"] / old["p50_ms"] - 1
+            line += f"  {change:+.0%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(r)
+        print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark command round trips against the simulator.")
+    parser.add_argument("--workloads", nargs="+", default=["single", "pipelined", "multi", "pollers", "interlock"])
+    parser.add_argument("-n", type=int, default=500, help="Commands per measurement")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated device latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--baudrate", type=int, default=None, help="Simulated wire speed")
+    parser.add_argument("--depth", type=int, default=8, help="Commands in flight for the pipelined workload")
+    parser.add_argument("--pollers", type=int, default=8)
+    parser.add_argument("--scale", type=int, default=100, help="Length of the synthetic UV-Vis log, in example runs")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    sim_kwargs = {"latency": args.latency, "jitter": args.jitter, "baudrate": args.baudrate, "seed": 0}
+    results = run_benchmarks(args.workloads, sim_kwargs, args.n, args.depth, args.pollers, args.scale)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.threshold)
+
+    if args.output:
+        report = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "config": {**sim_kwargs, "n": args.n, "depth": args.depth, "pollers": args.pollers, "scale": args.scale},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        sys.exit(1)
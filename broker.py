@@ -0,0 +1,336 @@
+"""
+Instrument broker: one long-running process owns the R2/R4 serial ports and
+every script, notebook or monitor talks to it instead of opening COM4/COM5.
+
+Protocol (newline terminated ASCII, requests may be pipelined):
+
+    client -> broker:  <request id> <module> <command>     e.g. "7 R2S FR 0 1000"
+    broker -> client:  <request id> <response>             e.g. "7 OK"
+
+Responses come back tagged with the request id, possibly out of order when a
+client talks to several modules. Each device serves the clients with pending
+commands round-robin, one command at a time, so a client queueing a long ramp
+cannot starve a monitor. GA requests are answered from a shared poll: however
+many clients ask, the device sees at most one GA per status period.
+
+Run the broker:
+    python broker.py --address tcp://127.0.0.1:8765 --modules R2S R2
+
+Use it from a script:
+    client = BrokerClient()
+    r2s = client.interface("R2S")
+    r2s.set_flowrate(0, 1000)
+    print(r2s.get_status())
+"""
+
+import argparse
+import asyncio
+import itertools
+import socket
+from collections import deque
+
+from async_flow import AsyncR2Interface
+from flow import SystemStatus
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:8765"
+DEFAULT_STATUS_PERIOD = 0.5
+
+def parse_address(address):
+    """Splits "tcp://host:port" or "unix:///path" into (family, target)."""
+    if address.startswith("unix://"):
+        return "unix", address[len("unix://"):]
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return "tcp", (host, int(port))
+    raise ValueError(f"Invalid broker address: {address}. Use tcp://host:port or unix:///path")
+
+###############
+### Devices ###
+###############
+
+class DeviceQueue:
+    """Fair scheduler for the commands sent to one device."""
+
+    def __init__(self, interface, status_period=DEFAULT_STATUS_PERIOD):
+        self.interface = interface
+        self.status_period = status_period
+
+        self._queues = {}
+        self._ready = deque()
+        self._wakeup = asyncio.Event()
+        self._worker = None
+
+        self._status = None
+        self._status_time = None
+        self._status_future = None
+
+        self.commands_sent = 0
+        self.status_polls_saved = 0
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        for queue in self._queues.values():
+            for _, future in queue:
+                if not future.done():
+                    future.set_exception(ConnectionError("Broker shutting down"))
+        self._queues.clear()
+        self._ready.clear()
+
+    def submit(self, client, command):
+        """Queues a command for a client and returns a future for its response."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(client, deque())
+        if not queue:
+            self._ready.append(client)
+        queue.append((command, future))
+        self._wakeup.set()
+        return future
+
+    async def status(self):
+        """GA response shared by every client asking within one status period."""
+        loop = asyncio.get_running_loop()
+        if self._status is not None and loop.time() - self._status_time < self.status_period:
+            self.status_polls_saved += 1
+            return self._status
+
+        if self._status_future is None:
+            self._status_future = self.submit(self, "GA")
+            self._status_future.add_done_callback(self._on_status)
+        else:
+            self.status_polls_saved += 1
+        return await asyncio.shield(self._status_future)
+
+    def _on_status(self, future):
+        self._status_future = None
+        if not future.cancelled() and future.exception() is None:
+            self._status = future.result()
+            self._status_time = asyncio.get_running_loop().time()
+
+    def drop_client(self, client):
+        queue = self._queues.pop(client, None)
+        if queue:
+            for _, future in queue:
+                future.cancel()
+        if client in self._ready:
+            self._ready.remove(client)
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            client = self._ready.popleft()
+            queue = self._queues[client]
+            command, future = queue.popleft()
+            if queue:
+                self._ready.append(client)
+            else:
+                del self._queues[client]
+
+            if future.done():
+                continue
+            try:
+                response = await self.interface._send(command)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.commands_sent += 1
+                if not future.done():
+                    future.set_result(response)
+
+##############
+### Broker ###
+##############
+
+class InstrumentBroker:
+
+    def __init__(self, interfaces, address=DEFAULT_ADDRESS, status_period=DEFAULT_STATUS_PERIOD):
+        """interfaces: module name -> AsyncR2Interface (not yet opened)."""
+        self.interfaces = interfaces
+        self.address = address
+        self.devices = {
+            module: DeviceQueue(interface, status_period)
+            for module, interface in interfaces.items()
+        }
+        self._server = None
+
+    async def start(self):
+        for interface in self.interfaces.values():
+            await interface.open()
+        for device in self.devices.values():
+            device.start()
+
+        family, target = parse_address(self.address)
+        if family == "unix":
+            self._server = await asyncio.start_unix_server(self._handle_client, path=target)
+        else:
+            self._server = await asyncio.start_server(self._handle_client, host=target[0], port=target[1])
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for device in self.devices.values():
+            await device.stop()
+        for interface in self.interfaces.values():
+            await interface.close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_client(self, reader, writer):
+        client = object()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.get_running_loop().create_task(self._handle_request(client, line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for device in self.devices.values():
+                device.drop_client(client)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _handle_request(self, client, line, writer):
+        parts = line.decode("ascii", errors="replace").strip().split(" ", 2)
+        request_id = parts[0]
+        try:
+            if len(parts) < 3:
+                raise ValueError("Expected '<request id> <module> <command>'")
+            module, command = parts[1], parts[2]
+            if module not in self.devices:
+                raise ValueError(f"Unknown module: {module}")
+
+            device = self.devices[module]
+            if command.strip() == "GA":
+                response = await device.status()
+            else:
+                response = await device.submit(client, command)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            response = f"ERROR {e}"
+
+        writer.write(f"{request_id} {response}\n".encode("ascii", errors="replace"))
+        await writer.drain()
+
+##############
+### Client ###
+##############
+
+class BrokerClient:
+    """Blocking client for the broker. Thread-unsafe: use one per thread."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=10):
+        family, target = parse_address(address)
+        if family == "unix":
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.settimeout(timeout)
+        self.socket.connect(target)
+
+        self._file = self.socket.makefile("rb")
+        self._ids = itertools.count()
+        self._responses = {}
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+    def send(self, module, command):
+        """Sends one command and waits for its response."""
+        return self.pipeline(module, [command])[0]
+
+    def pipeline(self, module, commands):
+        """Sends several commands back to back, then collects their responses in order."""
+        request_ids = [str(next(self._ids)) for _ in commands]
+        payload = "".join(f"{request_id} {module} {command}\n" for request_id, command in zip(request_ids, commands))
+        self.socket.sendall(payload.encode("ascii"))
+        return [self._wait_for(request_id) for request_id in request_ids]
+
+    def _wait_for(self, request_id):
+        while request_id not in self._responses:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError("Broker closed the connection")
+            response_id, _, response = line.decode("ascii", errors="replace").rstrip("\n").partition(" ")
+            self._responses[response_id] = response
+        return self._responses.pop(request_id)
+
+    def interface(self, module):
+        return RemoteR2Interface(self, module)
+
+class RemoteR2Interface:
+    """R2Interface command set routed through a BrokerClient."""
+
+    def __init__(self, client, module):
+        self.client = client
+        self.module = module
+
+    def _send(self, command):
+        return self.client.send(self.module, command)
+
+    def start(self):
+        return self._send("PN")
+
+    def stop(self):
+        return self._send("PF")
+
+    def set_flowrate(self, pump_id, flow_rate):
+        return self._send(f"FR {pump_id} {flow_rate}")
+
+    def switch_valve(self, valve_id):
+        return self._send(f"KP {valve_id}")
+
+    def set_temp(self, channel, target):
+        return self._send(f"R4 ST {channel} {target}")
+
+    def get_status(self) -> SystemStatus:
+        status = SystemStatus(self._send("GA"))
+        if not status.is_valid():
+            return {"error": "Invalid status data"}
+        return status
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve the Vapourtec serial ports to local clients.")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="tcp://host:port or unix:///path")
+    parser.add_argument("--modules", nargs="+", default=["R2S", "R2"])
+    parser.add_argument("--port", action="append", default=[], metavar="MODULE=PORT",
+                        help="Override the serial port of a module, e.g. R2S=/dev/pts/3")
+    parser.add_argument("--status-period", type=float, default=DEFAULT_STATUS_PERIOD,
+                        help="Seconds a GA response is shared between clients")
+    args = parser.parse_args()
+
+    ports = dict(override.split("=", 1) for override in args.port)
+    interfaces = {module: AsyncR2Interface(module=module, port=ports.get(module)) for module in args.modules}
+    broker = InstrumentBroker(interfaces, address=args.address, status_period=args.status_period)
+
+    print(f"Serving {', '.join(args.modules)} on {args.address}")
+    try:
+        asyncio.run(broker.serve_forever())
+    except KeyboardInterrupt:
+        pass
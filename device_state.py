@@ -0,0 +1,185 @@
+"""
+Cached mirror of the state written to a Vapourtec R2/R4.
+
+Every command that sets something (FR, KP, R4 ST, PN/PF) goes through
+DeviceStateMirror.submit. If the mirror already knows an FR, KP or ST channel
+holds the requested value the command is dropped instead of costing a serial
+round trip. PN and PF are always sent: the pumps can be started or stopped
+from the front panel, so a stop must never be skipped on the mirror's word.
+Inside a `with mirror.batch(send):` block, writes to the same channel are
+merged and only the last value is sent when the block exits.
+
+The mirror only trusts what it has seen: values confirmed by a successful
+write or by a GA readback. After a failed write the channel is forgotten,
+so the next write to it is always sent.
+"""
+
+from contextlib import contextmanager
+
+from flow import is_acknowledged
+
+RUN_KEY = ("RUN",)
+
+# GA run state flag -> pumps running. The over/underpressure states (2-7) are
+# faults in which the R2 has halted the pumps.
+RUN_STATES = {
+    0: False,   # off
+    1: True,    # running
+    2: False,   # system overpressure
+    3: False,   # pump A overpressure
+    4: False,   # pump B overpressure
+    5: False,   # underpressure (leak)
+    6: False,   # pump A underpressure
+    7: False,   # pump B underpressure
+}
+
+class DeviceStateMirror:
+
+    def __init__(self):
+        self.state = {}
+        self.round_trips_sent = 0
+        self.round_trips_saved = 0
+        self.fault = None           # last GA fault state, None when off or running
+
+        self._pending = None
+        self._send = None
+
+    ##################
+    ### Read State ###
+    ##################
+
+    @property
+    def running(self):
+        return self.state.get(RUN_KEY)
+
+    @property
+    def pump_rates(self):
+        """Pump id -> flow rate (uL/min)."""
+        return {key[1]: value for key, value in self.state.items() if key[0] == "FR"}
+
+    @property
+    def valve_positions(self):
+        """Valve (0-4) -> last valve id sent (0-9).
+        0 and 1 = first valve (R/S, A pump)
+        2 and 3 = second valve (R/S, B pump)
+        4 and 5 = third valve (top inj.)
+        6 and 7 = fourth valve (bottom inj.)
+        8 and 9 = fifth valve (waste/collection)"""
+        return {key[1]: value for key, value in self.state.items() if key[0] == "KP"}
+
+    @property
+    def set_points(self):
+        """Heater channel -> temperature set point."""
+        return {key[1]: value for key, value in self.state.items() if key[0] == "ST"}
+
+    @staticmethod
+    def parse(command):
+        """Returns the (channel key, value) a command writes, or None for
+        commands that do not change device state (GA, ...)."""
+        parts = command.split()
+        try:
+            if parts == ["PN"]:
+                return RUN_KEY, True
+            if parts == ["PF"]:
+                return RUN_KEY, False
+            if len(parts) == 3 and parts[0] == "FR":
+                return ("FR", int(parts[1])), float(parts[2])
+            if len(parts) == 2 and parts[0] == "KP":
+                valve_id = int(parts[1])
+                return ("KP", valve_id // 2), valve_id
+            if len(parts) == 4 and parts[:2] == ["R4", "ST"]:
+                return ("ST", int(parts[2])), float(parts[3])
+        except ValueError:
+            pass
+        return None
+
+    ###################
+    ### Write State ###
+    ###################
+
+    def submit(self, command, send):
+        """Sends a command through `send` unless it would not change anything.
+
+        Returns the device response, or None if the command was skipped or
+        deferred to the end of a batch."""
+
+        parsed = self.parse(command)
+        if parsed is None:
+            return self._round_trip(command, send)
+        key, value = parsed
+
+        if self._pending is not None:
+            if key != RUN_KEY:
+                if key in self._pending:
+                    self.round_trips_saved += 1
+                self._pending[key] = (value, command)
+                return None
+            # Power on/off must keep its place relative to the channel writes
+            self._flush()
+
+        return self._write(key, value, command, send)
+
+    def forget(self, key=None):
+        """Drops cached state, e.g. after a device was power cycled by hand."""
+        if key is None:
+            self.state.clear()
+        else:
+            self.state.pop(key, None)
+
+    def update_from_status(self, status):
+        """Syncs the mirror with a GA readback (flow.SystemStatus)."""
+        if not getattr(status, "valid", False):
+            return
+        flag = status.run_state_flag.value
+        if flag in RUN_STATES:
+            self.state[RUN_KEY] = RUN_STATES[flag]
+        else:
+            self.state.pop(RUN_KEY, None)
+        self.fault = status.run_state_flag if flag not in (0, 1) else None
+        self.state[("FR", 0)] = float(status.pump_a_flow_rate)
+        self.state[("FR", 1)] = float(status.pump_b_flow_rate)
+        for channel, set_point in enumerate(status.temperature_set_points):
+            self.state[("ST", channel)] = float(set_point)
+
+    @contextmanager
+    def batch(self, send):
+        """Merges writes to the same channel; the last value of each is sent on exit."""
+        if self._pending is not None:
+            yield self
+            return
+
+        self._pending, self._send = {}, send
+        try:
+            yield self
+        finally:
+            try:
+                self._flush()
+            finally:
+                self._pending, self._send = None, None
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        for key, (value, command) in pending.items():
+            self._write(key, value, command, self._send)
+
+    def _write(self, key, value, command, send):
+        if key != RUN_KEY and key in self.state and self.state[key] == value:
+            self.round_trips_saved += 1
+            return None
+
+        self.state.pop(key, None)
+        response = self._round_trip(command, send)
+        if is_acknowledged(response):
+            self.state[key] = value
+        return response
+
+    def _round_trip(self, command, send):
+        self.round_trips_sent += 1
+        return send(command)
+
+    def __str__(self):
+        return (
+            f"Device State: Running={self.running}, Pump Rates={self.pump_rates}, "
+            f"Valves={self.valve_positions}, Set Points={self.set_points}, "
+            f"Round Trips Sent={self.round_trips_sent}, Saved={self.round_trips_saved}"
+        )
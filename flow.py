@@ -1,4 +1,5 @@
 import serial
+import threading
 import time
 from enum import Enum
 
@@ -12,7 +13,32 @@ class RunStateFlag(Enum):
     PUMP_A_UNDERPRESSURE = 6
     PUMP_B_UNDERPRESSURE = 7
 
+OVERPRESSURE_FLAGS = (
+    RunStateFlag.SYSTEM_OVERPRESSURE,
+    RunStateFlag.PUMP_A_OVERPRESSURE,
+    RunStateFlag.PUMP_B_OVERPRESSURE,
+)
+UNDERPRESSURE_FLAGS = (
+    RunStateFlag.UNDERPRESSURE,
+    RunStateFlag.PUMP_A_UNDERPRESSURE,
+    RunStateFlag.PUMP_B_UNDERPRESSURE,
+)
+
 class SystemStatus:
+    
+    # Slots keep one sample small when a monitor holds many of them
+    __slots__ = (
+        "valid",
+        "error",
+        "run_state_flag",
+        "pump_a_flow_rate",
+        "pump_b_flow_rate",
+        "airlock_numbers",
+        "pressure_limit",
+        "front_panel_leds",
+        "temperature_set_points",
+    )
+    
     def __init__(self, response):
         """Response should be of format:
         1: Run State Flag: 
@@ -34,6 +60,7 @@ class SystemStatus:
         """
     
         self.valid = True
+        self.error = None
         try:
             parts = response.split(',')
             self.run_state_flag = RunStateFlag(int(parts[0]))
@@ -55,36 +82,115 @@ class SystemStatus:
             return f"Invalid System Status: {self.error}"
         return f"System Status: Run State={self.run_state_flag}, Pump A Rate={self.pump_a_flow_rate} uL/min, Pump B Rate={self.pump_b_flow_rate} uL/min"
 
+def is_acknowledged(response):
+    """True if a command response is a non-empty reply without an error."""
+    if isinstance(response, bytes):
+        response = response.decode("ascii", errors="ignore")
+    if response is None:
+        return False
+    response = response.strip()
+    return response != "" and "ERROR" not in response.upper()
+
+MODULE_PORTS = {
+    "R2S": "COM5",
+    "R2": "COM4",
+}
+
+def get_serial_port(module):
+    """Returns the COM port a module is wired to."""
+    if module not in MODULE_PORTS:
+        raise ValueError("Invalid module. Please choose either 'R2' or 'R2S'")
+    return MODULE_PORTS[module]
+
+def open_serial(port, timeout=2):
+    """Opens a serial connection with the Vapourtec line settings."""
+    return serial.Serial(
+        port = port,
+        baudrate = 19200,
+        bytesize = serial.EIGHTBITS,
+        parity = serial.PARITY_NONE,
+        stopbits = 1,
+        xonxoff = 1,
+        timeout = timeout
+    )
+
+class InterlockError(RuntimeError):
+    """Raised when a command is sent while an interlock has locked the interface out."""
+
+class CommandLock:
+    """Mutex for the serial line. Waiters are served first come, first served,
+    except urgent ones, which go ahead of everyone waiting."""
+    
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._held = False
+        self._urgent_waiting = 0
+        self._next_ticket = 0
+        self._serving = 0
+        
+    def acquire(self, urgent=False):
+        with self._condition:
+            if urgent:
+                self._urgent_waiting += 1
+                while self._held:
+                    self._condition.wait()
+                self._urgent_waiting -= 1
+            else:
+                ticket = self._next_ticket
+                self._next_ticket += 1
+                while self._held or self._urgent_waiting or ticket != self._serving:
+                    self._condition.wait()
+                self._serving += 1
+            self._held = True
+            
+    def release(self):
+        with self._condition:
+            self._held = False
+            self._condition.notify_all()
+
 class R2Interface:
     
-    def __init__(self, module="R2S"):
+    def __init__(self, module="R2S", port=None, mirror=None):
         
-        serial_port = None
-        if module == "R2S":
-            serial_port = "COM5"
-        elif module == "R2":
-            serial_port = "COM4"
-        else:
-            raise ValueError("Invalid module. Please choose either 'R2' or 'R2S'")
+        serial_port = port if port is not None else get_serial_port(module)
+        self.connection = open_serial(serial_port)
         
-        self.connection = serial.Serial(
-            port = serial_port,
-            baudrate = 19200,
-            bytesize = serial.EIGHTBITS,
-            parity = serial.PARITY_NONE,
-            stopbits = 1,
-            xonxoff = 1,
-            timeout = 2
-        )
+        # Optional device_state.DeviceStateMirror that drops redundant writes
+        self.mirror = mirror
         
-    def _send(self, command):
-        """Sends a command and waits for the response."""
-        command += "\r"
-        command_bytes = command.encode('ascii')
-        self.connection.write(command_bytes)
+        # Keeps a monitor thread polling GA from interleaving with commands
+        self._lock = CommandLock()
         
-        # Wait for a response
-        response = self.connection.readline()
+        # Set by an interlock (interlock.Interlock) to refuse further commands
+        self.lockout = None
+        
+    def _send(self, command, urgent=False):
+        """Sends a command and waits for the response.
+        Urgent commands (interlock actions) skip the queue of waiting commands and the mirror."""
+        if urgent:
+            response = self._round_trip(command, urgent=True)
+            if self.mirror is not None:
+                self.mirror.forget()
+            return response
+        if self.lockout is not None and command != "GA":
+            raise InterlockError(f"Refusing {command!r}: {self.lockout}")
+        if self.mirror is not None:
+            return self.mirror.submit(command, self._round_trip)
+        return self._round_trip(command)
+    
+    def _round_trip(self, command, urgent=False):
+        command_bytes = (command + "\r").encode('ascii')
+        self._lock.acquire(urgent)
+        try:
+            # An interlock may have tripped while this command waited for the line
+            if not urgent and self.lockout is not None and command != "GA":
+                raise InterlockError(f"Refusing {command!r}: {self.lockout}")
+            self.connection.write(command_bytes)
+            
+            # Wait for a response
+            response = self.connection.readline()
+        finally:
+            self._lock.release()
         
         return response.decode('ascii').strip()
         
@@ -146,6 +252,8 @@ class R2Interface:
         status = SystemStatus(response)
         if not status.is_valid():
             return {"error": "Invalid status data"}
+        if self.mirror is not None:
+            self.mirror.update_from_status(status)
         return status
         
     # def set_flowrate(self, channel, flow_rate):
@@ -0,0 +1,189 @@
+"""
+CSV ingest for the instrument readers in analysis.py.
+
+read_csv() parses only the columns a reader asks for. It uses the pyarrow
+engine when pyarrow is installed and the options allow it, and the pandas C
+parser otherwise. The parsed columns are then saved as a binary sidecar next
+to the source:
+
+    <data dir>/.sidecar/<file name>-<options hash>/
+        meta.json       source size + mtime, column names and dtypes
+        0.npy, 1.npy    one array per column
+
+The next read of the same file with the same options memory-maps the .npy
+files instead of parsing. cached_arrays() does the same for arrays built
+from many files (e.g. every IR spectrum of a run stacked into one matrix), and
+read_csv_bytes() parses CSV data that is already in memory (zip members). Maps are copy-on-write, so readers may modify the
+frame without touching the sidecar. A sidecar is rebuilt when the source
+size or mtime changes. Data directories that cannot be written to are read
+without a sidecar.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+SIDECAR_DIR = ".sidecar"
+SIDECAR_VERSION = 1
+
+# read_csv options the pyarrow engine supports (skipinitialspace is not one)
+_PYARROW_OPTIONS = {"usecols", "dtype", "delimiter", "sep", "header", "names"}
+
+def read_csv(path: str, sidecar: bool = True, **kwargs) -> pd.DataFrame:
+    """pd.read_csv with column projection, a faster engine and a binary sidecar."""
+    stat = os.stat(path)
+    cache_dir = sidecar_path(path, kwargs) if sidecar else None
+
+    if cache_dir is not None:
+        data = load_sidecar(cache_dir, stat)
+        if data is not None:
+            return data
+
+    data = pd.read_csv(path, engine=_engine(kwargs), **kwargs)
+
+    if cache_dir is not None:
+        try:
+            write_sidecar(cache_dir, data, stat)
+        except (OSError, TypeError, ValueError):
+            pass
+    return data
+
+def read_csv_bytes(raw: bytes, **kwargs) -> pd.DataFrame:
+    """read_csv for CSV data already in memory (e.g. a zip member). There is
+    no file to key a sidecar on, so this only projects columns and picks the
+    engine."""
+    return pd.read_csv(io.BytesIO(raw), engine=_engine(kwargs), **kwargs)
+
+def _engine(options: dict) -> str:
+    return "pyarrow" if HAS_PYARROW and set(options) <= _PYARROW_OPTIONS else "c"
+
+def sidecar_path(path: str, options: dict) -> str:
+    """Sidecar directory for a source file read with the given options."""
+    key = repr((SIDECAR_VERSION, sorted((name, repr(value)) for name, value in options.items())))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, SIDECAR_DIR, f"{name}-{digest}")
+
+def load_sidecar(cache_dir: str, stat: os.stat_result):
+    """The cached frame, or None if there is no sidecar or it is stale."""
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("size") != stat.st_size or meta.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+
+    columns = {}
+    for i, (name, dtype, pickled) in enumerate(zip(meta["columns"], meta["dtypes"], meta["pickled"])):
+        array_path = os.path.join(cache_dir, f"{i}.npy")
+        if pickled:
+            values = pd.array(np.load(array_path, allow_pickle=True), dtype=dtype)
+        else:
+            values = _load_array(array_path)
+        columns[name] = values
+    return pd.DataFrame(columns, copy=False)
+
+def write_sidecar(cache_dir: str, data: pd.DataFrame, stat: os.stat_result):
+    """Writes the sidecar into a temporary directory and moves it into place,
+    so a reader never sees a half written one."""
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        dtypes, pickled = [], []
+        for i, name in enumerate(data.columns):
+            column = data[name]
+            # Numeric columns are mapped on load; strings and mixed columns are pickled
+            is_numeric = isinstance(column.dtype, np.dtype) and column.dtype != object
+            if is_numeric:
+                np.save(os.path.join(tmp_dir, f"{i}.npy"), column.to_numpy())
+            else:
+                np.save(os.path.join(tmp_dir, f"{i}.npy"), column.to_numpy(dtype=object), allow_pickle=True)
+            dtypes.append(str(column.dtype))
+            pickled.append(not is_numeric)
+
+        meta = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "columns": [str(name) for name in data.columns],
+            "dtypes": dtypes,
+            "pickled": pickled,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        _replace_dir(tmp_dir, cache_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def cached_arrays(directory: str, name: str, sources, build) -> dict:
+    """Arrays derived from several source files, cached as memory-mapped .npy.
+
+    sources: the files the arrays are built from; their names, sizes and
+    mtimes key the cache. build: called without arguments on a miss,
+    returns name -> array."""
+    fingerprint = hashlib.sha1()
+    for path in sorted(sources):
+        stat = os.stat(path)
+        fingerprint.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    fingerprint = f"{SIDECAR_VERSION}-{fingerprint.hexdigest()}"
+    cache_dir = os.path.join(directory, SIDECAR_DIR, name)
+
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") == fingerprint:
+            return {key: _load_array(os.path.join(cache_dir, f"{key}.npy")) for key in meta["arrays"]}
+    except (OSError, ValueError):
+        pass
+
+    arrays = build()
+    try:
+        parent = os.path.dirname(cache_dir)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            for key, values in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{key}.npy"), np.ascontiguousarray(values))
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"fingerprint": fingerprint, "arrays": list(arrays)}, f)
+            _replace_dir(tmp_dir, cache_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    except OSError:
+        pass
+    return arrays
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode="c")
+    except ValueError:
+        # Empty arrays cannot be mapped
+        return np.load(path)
+
+def _replace_dir(tmp_dir, cache_dir):
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+def clear_sidecars(data_dir: str):
+    """Removes every sidecar below data_dir."""
+    for root, dirs, _ in os.walk(data_dir):
+        if SIDECAR_DIR in dirs:
+            shutil.rmtree(os.path.join(root, SIDECAR_DIR), ignore_errors=True)
+            dirs.remove(SIDECAR_DIR)
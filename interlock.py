@@ -0,0 +1,224 @@
+"""
+Overpressure/leak interlock on top of SystemMonitor.
+
+Interlock is a monitor listener that checks every status sample against a
+set of rules. When a rule fires it sends its safe-state commands (PF by
+default, optionally valve positions) as urgent commands that go ahead of
+anything the experiment script has queued. It then locks the interface so
+the script's next command raises flow.InterlockError instead of carrying on
+with the ramp. The time from detection to the device acknowledging the last
+action is recorded for every trip.
+
+    interlock = Interlock(r2, [RunStateRule(), FlowMismatchRule(r2.mirror)],
+                          actions=["PF", "KP 0", "KP 2"])
+    monitor.add_listener(interlock.on_sample)
+
+A command already on the wire cannot be interrupted, so the reaction bound is
+one poll period + one in-flight round trip + the action round trips.
+
+Only trips whose every action was acknowledged count towards the latency
+statistics. Actions that raised or were not acknowledged are recorded in
+failed_actions and retried on every following sample until the device
+acknowledges them.
+"""
+
+import inspect
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from flow import OVERPRESSURE_FLAGS, UNDERPRESSURE_FLAGS, is_acknowledged
+
+#############
+### Rules ###
+#############
+
+class RunStateRule:
+    """Fires on overpressure or underpressure (leak) run state flags."""
+
+    def __init__(self, flags=OVERPRESSURE_FLAGS + UNDERPRESSURE_FLAGS):
+        self.flags = set(flags)
+        self.name = "run state"
+
+    def check(self, timestamp, status):
+        if status.run_state_flag in self.flags:
+            return f"run state {status.run_state_flag.name}"
+        return None
+
+class PressureLimitRule:
+    """Fires if the pressure limit reported by GA is above what this setup tolerates.
+
+    GA reports the configured limit, not the measured pressure, so this
+    guards against running with a limit someone raised on the front panel."""
+
+    def __init__(self, max_pressure_limit_mbar):
+        self.max_pressure_limit_mbar = max_pressure_limit_mbar
+        self.name = "pressure limit"
+
+    def check(self, timestamp, status):
+        if status.pressure_limit > self.max_pressure_limit_mbar:
+            return f"pressure limit {status.pressure_limit} mbar > {self.max_pressure_limit_mbar} mbar"
+        return None
+
+class FlowMismatchRule:
+    """Fires when a pump's readback stays away from its commanded rate.
+
+    Commanded rates come from a device_state.DeviceStateMirror. The mismatch
+    has to persist for grace_s, so normal pump ramp up does not trip it."""
+
+    def __init__(self, mirror, tolerance=0.1, min_difference=10.0, grace_s=5.0):
+        self.mirror = mirror
+        self.tolerance = tolerance              # relative
+        self.min_difference = min_difference    # uL/min
+        self.grace_s = grace_s
+        self.name = "flow mismatch"
+        self._since = {}
+
+    def check(self, timestamp, status):
+        if not self.mirror.running:
+            self._since.clear()
+            return None
+
+        commanded = self.mirror.pump_rates
+        readbacks = {0: status.pump_a_flow_rate, 1: status.pump_b_flow_rate}
+        for pump, readback in readbacks.items():
+            if pump not in commanded:
+                continue
+            difference = abs(readback - commanded[pump])
+            if difference > max(self.min_difference, self.tolerance * commanded[pump]):
+                since = self._since.setdefault(pump, timestamp)
+                if timestamp - since >= self.grace_s:
+                    return f"pump {pump} at {readback:g} uL/min, commanded {commanded[pump]:g} uL/min"
+            else:
+                self._since.pop(pump, None)
+        return None
+
+#################
+### Interlock ###
+#################
+
+class Interlock:
+
+    def __init__(self, interface, rules, actions=("PF",), lockout=True, history=10000):
+        _check_interface(interface)
+        self.interface = interface
+        self.rules = list(rules)
+        self.actions = list(actions)
+        self.lockout = lockout
+
+        self.tripped = None
+        self.trips = []
+        self.latencies = deque(maxlen=history)   # detection to last action acknowledged (s)
+        self.failed_actions = deque(maxlen=history)
+        self._unacknowledged = []
+        self._lock = threading.Lock()
+
+    @property
+    def safe(self):
+        """True unless a trip's safe-state actions are still unacknowledged."""
+        return not self._unacknowledged
+
+    def on_sample(self, timestamp, status):
+        """SystemMonitor listener."""
+        if self.tripped is not None:
+            if self._unacknowledged:
+                self._retry()
+            return
+        for rule in self.rules:
+            reason = rule.check(timestamp, status)
+            if reason is not None:
+                self.trip(f"{rule.name}: {reason}")
+                return
+
+    def trip(self, reason):
+        """Puts the device in its safe state. Only the first trip acts until reset()."""
+        detected = time.perf_counter()
+        with self._lock:
+            if self.tripped is not None:
+                return
+            self.tripped = reason
+
+        if self.lockout:
+            self.interface.lockout = f"interlock tripped ({reason})"
+
+        responses, failed = [], []
+        for command in self.actions:
+            response = self._act(command)
+            responses.append(response)
+            if not is_acknowledged(response):
+                failed.append(command)
+                self.failed_actions.append({"time": time.time(), "command": command, "response": response})
+        latency = time.perf_counter() - detected
+
+        # A trip only proves a reaction time if the device acknowledged it
+        if not failed:
+            self.latencies.append(latency)
+        self._unacknowledged = failed
+        self.trips.append({
+            "time": time.time(),
+            "reason": reason,
+            "latency_s": latency if not failed else None,
+            "responses": responses,
+            "failed": failed,
+        })
+
+    def _act(self, command):
+        try:
+            return self.interface._send(command, urgent=True)
+        except Exception as e:
+            return f"ERROR {e!r}"
+
+    def _retry(self):
+        still_failed = []
+        for command in self._unacknowledged:
+            response = self._act(command)
+            if not is_acknowledged(response):
+                still_failed.append(command)
+                self.failed_actions.append({"time": time.time(), "command": command, "response": response})
+        self._unacknowledged = still_failed
+
+    def reset(self):
+        """Re-arms the interlock and unlocks the interface once the fault is cleared."""
+        with self._lock:
+            self.tripped = None
+            self._unacknowledged = []
+        self.interface.lockout = None
+
+    def latency_percentiles(self, percentiles=(50, 95, 99, 100)):
+        """Detection to action latency in ms."""
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.asarray(self.latencies) * 1000, percentiles)
+        return dict(zip(percentiles, values))
+
+    def latency_histogram(self, bins_ms=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)):
+        """Counts of detection to action latencies per bin (ms)."""
+        counts, edges = np.histogram(np.asarray(self.latencies) * 1000, bins=bins_ms)
+        return counts, edges
+
+    def __str__(self):
+        state = f"TRIPPED ({self.tripped})" if self.tripped else "armed"
+        if self._unacknowledged:
+            state += f", UNACKNOWLEDGED {self._unacknowledged}"
+        return (
+            f"Interlock: {state}, Trips={len(self.trips)}, Failed Actions={len(self.failed_actions)}, "
+            f"Latency ms={self.latency_percentiles()}"
+        )
+
+def _check_interface(interface):
+    # The safe-state actions jump the command queue, which needs
+    # flow.R2Interface._send(command, urgent=True) and its lockout
+    send = getattr(interface, "_send", None)
+    if send is None or inspect.iscoroutinefunction(send):
+        raise TypeError(f"{type(interface).__name__} has no blocking _send; the interlock needs flow.R2Interface.")
+    parameters = inspect.signature(send).parameters
+    accepts_urgent = "urgent" in parameters or any(
+        p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values()
+    )
+    if not accepts_urgent or not hasattr(interface, "lockout"):
+        raise TypeError(
+            f"{type(interface).__name__} does not support urgent commands and lockout; "
+            "the interlock needs flow.R2Interface."
+        )
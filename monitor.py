@@ -1,11 +1,457 @@
 import threading
 import time
+from collections import deque
 from datetime import datetime
 
+import numpy as np
+
+from flow import is_acknowledged
+
+# Columns of one status sample, in ring buffer order. "time" is the wall
+# clock (for records); intervals use "monotonic_time", which NTP or DST
+# steps cannot move.
+STATUS_COLUMNS = (
+    "time",
+    "monotonic_time",
+    "run_state",
+    "pump_a_flow_rate",
+    "pump_b_flow_rate",
+    "airlock_a",
+    "airlock_b",
+    "pressure_limit",
+    "set_point_0",
+    "set_point_1",
+    "set_point_2",
+    "set_point_3",
+)
+
+NUM_SET_POINTS = 4
+
+def status_to_row(timestamp, status, wall_time=None):
+    """Flattens a flow.SystemStatus into a row of STATUS_COLUMNS.
+
+    timestamp is the time.monotonic() time of the sample (as passed to
+    monitor listeners); wall_time defaults to now. GA replies may carry fewer
+    than four set points (the 10 field format); missing ones are NaN."""
+    set_points = list(status.temperature_set_points)[:NUM_SET_POINTS]
+    set_points += [np.nan] * (NUM_SET_POINTS - len(set_points))
+    return (
+        time.time() if wall_time is None else wall_time,
+        timestamp,
+        status.run_state_flag.value,
+        status.pump_a_flow_rate,
+        status.pump_b_flow_rate,
+        status.airlock_numbers[0],
+        status.airlock_numbers[1],
+        status.pressure_limit,
+        *set_points,
+    )
+
+class StatusRingBuffer:
+    """Fixed capacity ring buffer of status samples.
+
+    Every row is written twice, at i and i + capacity, so the most recent
+    samples always form one contiguous block and any window of them can be
+    returned as a NumPy view. Appends are O(1) and memory never grows.
+    Views are not snapshots: copy them if the poller keeps writing while
+    you use them."""
+
+    def __init__(self, capacity, columns=STATUS_COLUMNS, dtype=np.float64):
+        self.capacity = capacity
+        self.columns = columns
+        self._index = {name: i for i, name in enumerate(columns)}
+        self._data = np.full((2 * capacity, len(columns)), np.nan, dtype=dtype)
+        self._head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        self._data[self._head] = row
+        self._data[self._head + self.capacity] = row
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self, n=None):
+        """View of the last n samples (all samples if n is None), oldest first."""
+        n = self.count if n is None else min(n, self.count)
+        end = self._head + self.capacity
+        return self._data[end - n:end]
+
+    def window(self, seconds):
+        """View of the samples taken in the last `seconds` before the newest one."""
+        samples = self.latest()
+        if not len(samples):
+            return samples
+        times = samples[:, self._index["monotonic_time"]]
+        start = np.searchsorted(times, times[-1] - seconds, side="left")
+        return samples[start:]
+
+    def column(self, name, n=None):
+        return self.latest(n)[:, self._index[name]]
+
+# Pump -> the R/S valve in front of it (valve ids 0/1 and 2/3)
+PUMP_VALVES = {0: 0, 1: 1}
+
+REAGENT = "reagent"
+SOLVENT = "solvent"
+UNKNOWN = "unknown"
+
+class VolumeLimit:
+
+    __slots__ = ("pump", "position", "limit_mL", "action", "tripped", "unacknowledged")
+
+    def __init__(self, pump, position, limit_mL, action):
+        self.pump = pump
+        self.position = position
+        self.limit_mL = limit_mL
+        self.action = action
+        self.tripped = False
+        self.unacknowledged = []    # actions to retry on the next sample
+
+class VolumeAccountant:
+    """Running totals of the volume each pump has dispensed.
+
+    A monitor listener: every sample adds rate x time since the previous one,
+    so the cost per sample is constant however long the run is. Rates are
+    the measured GA readbacks (trapezoid between samples) or, with
+    source="commanded", the rates in a DeviceStateMirror (held between
+    samples). Volume is also booked per R/S valve position, read from the
+    mirror: odd valve ids draw from the reagent loop, even ids from solvent.
+
+    set_limit() guards a reservoir. When the next sample (plus margin_s)
+    would take it past its limit, the pump is switched to solvent or
+    stopped, so an unattended ramp cannot run a reagent loop dry. A limit
+    only counts as tripped once the device acknowledged every action; actions
+    that raised or were not acknowledged are retried on every following
+    sample and recorded in failed_actions.
+
+        accountant = VolumeAccountant(r2, r2.mirror)
+        accountant.set_limit(0, 8.0)                      # 8 mL of reagent A
+        accountant.set_limit(1, 50.0, SOLVENT, "stop")
+        monitor.add_listener(accountant.on_sample)
+    """
+
+    def __init__(self, interface=None, mirror=None, source="measured", margin_s=1.0, history=10000):
+        if source not in ("measured", "commanded"):
+            raise ValueError(f"Invalid source: {source}. Must be 'measured' or 'commanded'.")
+        if source == "commanded" and mirror is None:
+            raise ValueError("Commanded rates need a DeviceStateMirror.")
+        self.interface = interface
+        self.mirror = mirror
+        self.source = source
+        self.margin_s = margin_s
+
+        self.totals = {pump: 0.0 for pump in PUMP_VALVES}      # mL
+        self.by_position = {}                                   # (pump, position) -> mL
+        self.limits = []
+        self.events = []
+        self.failed_actions = deque(maxlen=history)
+
+        self._lock = threading.Lock()
+        self._last_time = None
+        self._last_rates = {pump: 0.0 for pump in PUMP_VALVES}  # uL/min
+        self._last_positions = {pump: UNKNOWN for pump in PUMP_VALVES}
+        self._period_s = 0.0
+
+    def set_limit(self, pump, limit_mL, position=REAGENT, action="switch"):
+        """action: "switch" (valve to the other R/S position), "stop" (PF)
+        or a list of commands. position=None limits the pump's total volume.
+
+        A limit on one valve position needs the valve's position, i.e. a
+        mirror that has seen the valve switched. While the position is
+        unknown later on (e.g. the mirror was reset), the volume counts
+        towards the limit, so the limit errs on the early side."""
+        if action not in ("switch", "stop") and isinstance(action, str):
+            raise ValueError(f"Invalid action: {action}. Must be 'switch', 'stop' or a list of commands.")
+        if action == "switch" and position is None:
+            raise ValueError("A total volume limit cannot switch the valve; use action='stop'.")
+        if position is not None and self.position(pump) == UNKNOWN:
+            raise ValueError(
+                f"Valve position of pump {pump} is unknown: pass a mirror that has seen the valve "
+                "switched, or limit the total volume with position=None."
+            )
+        limit = VolumeLimit(pump, position, limit_mL, action)
+        self.limits.append(limit)
+        return limit
+
+    def position(self, pump):
+        if self.mirror is None:
+            return UNKNOWN
+        valve_id = self.mirror.valve_positions.get(PUMP_VALVES[pump])
+        if valve_id is None:
+            return UNKNOWN
+        return REAGENT if valve_id % 2 else SOLVENT
+
+    def rates(self, status):
+        """Pump -> flow rate (uL/min) for this sample."""
+        if self.source == "measured":
+            return {0: status.pump_a_flow_rate, 1: status.pump_b_flow_rate}
+        if not self.mirror.running:
+            return {pump: 0.0 for pump in PUMP_VALVES}
+        commanded = self.mirror.pump_rates
+        return {pump: commanded.get(pump, 0.0) for pump in PUMP_VALVES}
+
+    def on_sample(self, timestamp, status):
+        """SystemMonitor listener."""
+        rates = self.rates(status)
+        with self._lock:
+            if self._last_time is not None:
+                dt_min = (timestamp - self._last_time) / 60
+                for pump, rate in rates.items():
+                    if self.source == "measured":
+                        rate = (rate + self._last_rates[pump]) / 2
+                    else:
+                        rate = self._last_rates[pump]
+                    volume_mL = rate * dt_min / 1000
+                    key = (pump, self._last_positions[pump])
+                    self.totals[pump] += volume_mL
+                    self.by_position[key] = self.by_position.get(key, 0.0) + volume_mL
+                self._period_s = timestamp - self._last_time
+
+            self._last_time = timestamp
+            self._last_rates = rates
+            self._last_positions = {pump: self.position(pump) for pump in PUMP_VALVES}
+
+        self._check_limits(timestamp)
+
+    def dispensed(self, pump, position=None):
+        """mL dispensed by a pump, in total or from one valve position."""
+        if position is None:
+            return self.totals[pump]
+        return self.by_position.get((pump, position), 0.0)
+
+    def time_to_limit(self):
+        """(pump, position) -> seconds until each limit is reached at the
+        current rate. inf while the pump is not drawing from that position."""
+        projections = {}
+        for limit in self.limits:
+            remaining_mL = limit.limit_mL - self._counted(limit)
+            rate_mL_s = self._drawing_rate(limit) / 60000
+            projections[(limit.pump, limit.position)] = (
+                max(0.0, remaining_mL) / rate_mL_s if rate_mL_s > 0 else float("inf")
+            )
+        return projections
+
+    def _counted(self, limit):
+        # Volume booked against a limit, including any drawn while the valve
+        # position was unknown
+        if limit.position is None:
+            return self.totals[limit.pump]
+        return self.dispensed(limit.pump, limit.position) + self.dispensed(limit.pump, UNKNOWN)
+
+    def _drawing_rate(self, limit):
+        if self._last_positions[limit.pump] not in (limit.position, UNKNOWN) and limit.position is not None:
+            return 0.0
+        return self._last_rates[limit.pump]
+
+    def _check_limits(self, timestamp):
+        for limit in self.limits:
+            if limit.tripped:
+                continue
+            retry = bool(limit.unacknowledged)
+            if retry:
+                # A previous attempt failed: retry it whatever the rate now is
+                commands = limit.unacknowledged
+            else:
+                rate_mL_s = self._drawing_rate(limit) / 60000
+                if rate_mL_s <= 0:
+                    continue
+                remaining_mL = limit.limit_mL - self._counted(limit)
+                if remaining_mL > rate_mL_s * (self._period_s + self.margin_s):
+                    continue
+                commands = self._commands(limit)
+
+            responses, failed = [], []
+            for command in commands:
+                response = self._act(command)
+                responses.append(response)
+                if not is_acknowledged(response):
+                    failed.append(command)
+                    self.failed_actions.append({"time": time.time(), "command": command, "response": response})
+            limit.unacknowledged = failed
+            limit.tripped = not failed
+            if retry and failed:
+                continue
+            self.events.append({
+                "time": time.time(),
+                "pump": limit.pump,
+                "position": limit.position,
+                "dispensed_mL": self._counted(limit),
+                "limit_mL": limit.limit_mL,
+                "responses": responses,
+                "failed": failed,
+            })
+
+    def _act(self, command):
+        # A limit action is always sent, never dropped on the mirror's word
+        mirror = getattr(self.interface, "mirror", None)
+        if mirror is not None:
+            parsed = mirror.parse(command)
+            if parsed is not None:
+                mirror.forget(parsed[0])
+        try:
+            return self.interface._send(command)
+        except Exception as e:
+            return f"ERROR {e!r}"
+
+    def _commands(self, limit):
+        if limit.action == "stop":
+            return ["PF"]
+        if limit.action == "switch":
+            # To the other R/S position (solvent for a reagent limit)
+            other_id = 2 * PUMP_VALVES[limit.pump] + (0 if limit.position == REAGENT else 1)
+            return [f"KP {other_id}"]
+        return list(limit.action)
+
+    def __str__(self):
+        totals = ", ".join(f"Pump {pump}={volume:.3f} mL" for pump, volume in self.totals.items())
+        return (
+            f"Volume Accountant: {totals}, Limit Events={len(self.events)}, "
+            f"Failed Actions={len(self.failed_actions)}"
+        )
+
 class SystemMonitor:
-    
-    def __init__(self, interface):
+    """Polls GA in a background thread and keeps the samples in a ring buffer.
+
+    The interface needs a get_status() returning flow.SystemStatus, e.g.
+    flow.R2Interface. Listeners are called from the polling thread with
+    (timestamp, status) for every valid sample, timestamp being
+    time.monotonic(); the wall clock is only recorded in the "time" column. A listener that raises is
+    counted in listener_errors and does not stop the poller or the other
+    listeners. If the polling thread dies anyway, on_failure is called with
+    the exception and check() raises."""
+
+    def __init__(self, interface, rate_hz=10, capacity=None, history_s=3600, on_failure=None):
         self.interface = interface
+        self.rate_hz = rate_hz
+        self.on_failure = on_failure
+        self.running = False
+        self.failure = None
+
+        if capacity is None:
+            capacity = int(rate_hz * history_s)
+        self.status_log = StatusRingBuffer(capacity)
+        self.latest = None
+        self.latest_time = None         # time.monotonic() of the latest sample
+
+        self.samples = 0
+        self.errors = 0
+        self.missed_deadlines = 0
+        self.listener_errors = {}       # callback -> number of exceptions
+        self.last_listener_error = None
+
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.failure = None
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="system-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
         self.running = False
-        self.status_log = []
-        
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def check(self, max_age_s=None):
+        """Raises RuntimeError if the monitor should be polling but its thread
+        is gone, or (with max_age_s) if its latest valid sample is older than that."""
+        if self.failure is not None or (self.running and not self.is_alive()):
+            raise RuntimeError(f"System monitor stopped polling: {self.failure!r}")
+        if max_age_s is not None and self.running:
+            age = None if self.latest_time is None else time.monotonic() - self.latest_time
+            if age is None or age > max_age_s:
+                raise RuntimeError(f"System monitor has no valid sample in the last {max_age_s} s.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def poll(self):
+        """Takes one sample. Returns the status, or None if it was invalid."""
+        try:
+            status = self.interface.get_status()
+        except Exception:
+            self.errors += 1
+            return None
+
+        if not getattr(status, "valid", False):
+            self.errors += 1
+            return None
+
+        timestamp = time.monotonic()
+        try:
+            row = status_to_row(timestamp, status, wall_time=time.time())
+            if len(row) != len(STATUS_COLUMNS):
+                raise ValueError(f"Status row has {len(row)} fields, expected {len(STATUS_COLUMNS)}.")
+            self.status_log.append(row)
+        except (AttributeError, TypeError, ValueError):
+            self.errors += 1
+            return None
+        self.latest = status
+        self.latest_time = timestamp
+        self.samples += 1
+
+        for callback in list(self._listeners):
+            try:
+                callback(timestamp, status)
+            except Exception as e:
+                self.listener_errors[callback] = self.listener_errors.get(callback, 0) + 1
+                self.last_listener_error = e
+        return status
+
+    def _run(self):
+        try:
+            self._poll_loop()
+        except Exception as e:
+            self.failure = e
+            self.running = False
+            if self.on_failure is not None:
+                self.on_failure(e)
+
+    def _poll_loop(self):
+        period = 1.0 / self.rate_hz
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            self.poll()
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                # Too slow for the requested rate: skip the missed ticks
+                # instead of polling back to back to catch up.
+                missed = int(-delay // period) + 1
+                self.missed_deadlines += missed
+                deadline += missed * period
+                delay = deadline - time.monotonic()
+            self._stop.wait(max(0.0, delay))
+
+    def __str__(self):
+        started = datetime.fromtimestamp(self.status_log.latest()[0, 0]) if self.samples else None
+        return (
+            f"System Monitor: Running={self.running}, Rate={self.rate_hz} Hz, "
+            f"Samples={self.samples}, Errors={self.errors}, "
+            f"Listener Errors={sum(self.listener_errors.values())}, Buffered Since={started}"
+        )
@@ -1,12 +1,20 @@
+# Uses device_state, ramps and scheduler from the repository root; run it
+# from there as a module: python -m new_code.flow
 import serial
 import time
 import numpy as np
 import datetime
 
+from device_state import DeviceStateMirror
+from ramps import add_to_scheduler, compile_ramp
+from scheduler import DeadlineScheduler
+
 class R2Interface:
-    def __init__(self, serial_port):
+    def __init__(self, serial_port, mirror=None):
         self.connection =  serial.Serial(port = serial_port, baudrate=19200, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
             stopbits=1, xonxoff=1, timeout=2)
+        # Optional DeviceStateMirror that skips writes the device already has
+        self.mirror = mirror
 
     def Start(self):
         msg = "PN"
@@ -35,7 +43,12 @@ class R2Interface:
         msg = "FR " + str(ID) + " " + str(flow_rate)
         self.send_command(msg)
 
-    def send_command(self,command):
+    def send_command(self, command):
+        if self.mirror is not None:
+            return self.mirror.submit(command, self._round_trip)
+        return self._round_trip(command)
+
+    def _round_trip(self, command):
         command = command + "\r"
         command_bytes = command.encode('ascii')
         self.connection.write(command_bytes)
@@ -51,52 +64,57 @@ class R2Interface:
             print(R2.connection.readline().decode('ascii')) 
 
 def flow_rate_ramp(r2: R2Interface, F0_mL_per_min, F1_mL_per_min):
-    r2.switch_valve(1)
 
     ramp_time_min = 10
     increment_time_s = 15
-    increment_time_min = increment_time_s / 60
-    num_increments = int(ramp_time_min / increment_time_min) + 1
-    time_steps = np.linspace(0, ramp_time_min, num=num_increments)
-    print(time_steps)
-    flow_rates = F0_mL_per_min + (F1_mL_per_min - F0_mL_per_min) * (time_steps / ramp_time_min)
-    print(flow_rates)
-
-
-    r2.SetFlowRate(int(flow_rates[0]*1000), 0)
-    time.sleep(60)
-    r2.switch_valve(1)
-
-    for i, flow_rate in enumerate(flow_rates):
-        time_step = time_steps[i]
-        print(f'{datetime.datetime.now()}: {i} {time_step} {flow_rate}')
-        r2.SetFlowRate(int(flow_rate*1000), 0)
-        time.sleep(increment_time_s)
-
-    r2.switch_valve(0)
+    pickup_time_s = 60
+    num_increments = int(ramp_time_min * 60 / increment_time_s) + 1
+
+    # Hold F0 during pickup, then ramp linearly; back to solvent one step after the last rate
+    schedule = compile_ramp({
+        "increment_time_s": increment_time_s,
+        "pumps": {
+            0: {"shape": "linear", "start": F0_mL_per_min, "end": F1_mL_per_min,
+                "duration_min": ramp_time_min, "hold_s": pickup_time_s},
+        },
+        "valves": [(0, 1), (pickup_time_s, 1), (pickup_time_s + num_increments * increment_time_s, 0)],
+    })
+    print(schedule)
+
+    # Every step is planned from the same start time, so slow serial round
+    # trips no longer push the rest of the ramp back.
+    scheduler = DeadlineScheduler(verbose=True)
+    add_to_scheduler(schedule, r2, scheduler)
+
+    print(f'{datetime.datetime.now()}: starting ramp')
+    scheduler.run()
+    print(scheduler.report())
 
 def simple_flow_sweep(r2: R2Interface, F0_mL_per_min, F1_mL_per_min, pickup_vol_mL=4, reactor_vol_mL=2):
 
-    r2.switch_valve(1)
-    r2.switch_valve(3)
-    
-    r2.SetFlowRate(F0_mL_per_min * 1000, 0)
-    r2.SetFlowRate(F0_mL_per_min * 1000, 1)
     min_res_time_min = reactor_vol_mL / F0_mL_per_min
     print(f'Min residence time: {min_res_time_min} min')
 
     pickup_time_min = pickup_vol_mL / F0_mL_per_min
     pickup_time_s = pickup_time_min * 60
     print(f'Waiting for {pickup_time_min} min.')
-    time.sleep(pickup_time_s)
 
-    r2.SetFlowRate(F1_mL_per_min * 1000, 0)
-    r2.SetFlowRate(F1_mL_per_min * 1000, 1)
     max_res_time_min = reactor_vol_mL / F1_mL_per_min
     print(f'Max residence time: {max_res_time_min} min')
 
-    r2.switch_valve(0)
-    r2.switch_valve(2)
+    scheduler = DeadlineScheduler(verbose=True)
+    scheduler.at(0, r2.switch_valve, 1)
+    scheduler.at(0, r2.switch_valve, 3)
+    scheduler.at(0, r2.SetFlowRate, F0_mL_per_min * 1000, 0)
+    scheduler.at(0, r2.SetFlowRate, F0_mL_per_min * 1000, 1)
+
+    scheduler.at(pickup_time_s, r2.SetFlowRate, F1_mL_per_min * 1000, 0)
+    scheduler.at(pickup_time_s, r2.SetFlowRate, F1_mL_per_min * 1000, 1)
+    scheduler.at(pickup_time_s, r2.switch_valve, 0)
+    scheduler.at(pickup_time_s, r2.switch_valve, 2)
+
+    scheduler.run()
+    print(scheduler.report())
 
 def set_temperature(r4: R2Interface, temperature):
 
@@ -106,8 +124,8 @@ def set_temperature(r4: R2Interface, temperature):
 
 if __name__ == "__main__":
 
-    R4 = R2Interface('COM4')
-    R2S = R2Interface('COM5')
+    R4 = R2Interface('COM4', mirror=DeviceStateMirror())
+    R2S = R2Interface('COM5', mirror=DeviceStateMirror())
     R2S.stop_experiment()
     R2S.Start()
 
@@ -0,0 +1,233 @@
+"""
+Runs one experiment across several reactors as concurrent asyncio tasks.
+
+An experiment is a set of named steps. A step can depend on other steps
+(`after`), wait for a condition (`when`, e.g. a heater set point having
+been in place for its heat-up time) and be held until a time on the shared experiment clock (`at_s`).
+Steps whose prerequisites are met run at the same time. Heating the R4 and
+priming the R2S therefore overlap, where the blocking scripts ran them one
+after the other.
+
+    orchestrator = Orchestrator({"R2S": r2s, "R4": r4})
+    orchestrator.step("heat", lambda o: set_temperature(o.devices["R4"], 3, 50))
+    orchestrator.step("prime", lambda o: prime(o.devices["R2S"]))
+    orchestrator.step("sweep", lambda o: sweep(o, o.devices["R2S"]),
+                      after=["prime"], when=set_point_settled("R4", 3, 50, settle_s=600))
+    await orchestrator.run()
+"""
+
+import asyncio
+import time
+
+from async_flow import AsyncR2Interface
+
+class Step:
+
+    __slots__ = ("name", "action", "after", "when", "at_s", "poll_s", "timeout_s",
+                 "started_s", "finished_s", "result", "error")
+
+    def __init__(self, name, action, after, when, at_s, poll_s, timeout_s):
+        self.name = name
+        self.action = action
+        self.after = list(after)
+        self.when = when
+        self.at_s = at_s
+        self.poll_s = poll_s
+        self.timeout_s = timeout_s
+
+        self.started_s = None
+        self.finished_s = None
+        self.result = None
+        self.error = None
+
+class Orchestrator:
+
+    def __init__(self, devices):
+        """devices: name -> AsyncR2Interface (opened by the caller)."""
+        self.devices = devices
+        self.steps = {}
+        self.start_time = None
+
+    ##################
+    ### Definition ###
+    ##################
+
+    def step(self, name, action, after=(), when=None, at_s=None, poll_s=1.0, timeout_s=None):
+        """Adds a step.
+
+        action: async function called with the orchestrator.
+        after: names of steps that must have finished successfully first.
+        when: async predicate called with the orchestrator, polled every
+            poll_s until it returns True (or timeout_s passes).
+        at_s: earliest start on the experiment clock, in seconds.
+        """
+        if name in self.steps:
+            raise ValueError(f"Step already defined: {name}")
+        self.steps[name] = Step(name, action, after, when, at_s, poll_s, timeout_s)
+        return self
+
+    #################
+    ### Execution ###
+    #################
+
+    def now(self):
+        """Seconds on the shared experiment clock."""
+        return time.monotonic() - self.start_time
+
+    async def sleep_until(self, t_s):
+        """Sleeps until t_s on the experiment clock, without accumulating drift."""
+        delay = t_s - self.now()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def run(self):
+        """Runs every step and returns name -> result. Raises the first step
+        error after the remaining independent steps have finished."""
+        for step in self.steps.values():
+            for dependency in step.after:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+        self._check_cycles()
+
+        self.start_time = time.monotonic()
+        tasks = {}
+        for name in self.steps:
+            tasks[name] = asyncio.ensure_future(self._run_step(self.steps[name], tasks))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        for step in self.steps.values():
+            if step.error is not None:
+                raise RuntimeError(f"Step {step.name} failed: {step.error!r}") from step.error
+        return {name: step.result for name, step in self.steps.items()}
+
+    async def _run_step(self, step, tasks):
+        try:
+            for dependency in step.after:
+                await asyncio.shield(tasks[dependency])
+                if self.steps[dependency].error is not None:
+                    raise RuntimeError(f"dependency {dependency} failed")
+
+            if step.at_s is not None:
+                await self.sleep_until(step.at_s)
+
+            if step.when is not None:
+                await asyncio.wait_for(self._wait_for(step), step.timeout_s)
+
+            step.started_s = self.now()
+            step.result = await step.action(self)
+            step.finished_s = self.now()
+        except Exception as e:
+            step.error = e
+
+    async def _wait_for(self, step):
+        while not await step.when(self):
+            await asyncio.sleep(step.poll_s)
+
+    def _check_cycles(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Step dependencies form a cycle through {name}")
+            visiting.add(name)
+            for dependency in self.steps[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    def timeline(self):
+        """One line per step: start and end on the experiment clock."""
+        lines = []
+        for step in sorted(self.steps.values(), key=lambda s: (s.started_s is None, s.started_s)):
+            if step.error is not None:
+                lines.append(f"{step.name:<20} FAILED: {step.error!r}")
+            elif step.started_s is None:
+                lines.append(f"{step.name:<20} not run")
+            else:
+                lines.append(f"{step.name:<20} {step.started_s:9.2f} s -> {step.finished_s:9.2f} s")
+        return "\n".join(lines)
+
+##################
+### Conditions ###
+##################
+
+def set_point_settled(device, channel, target, settle_s, tolerance=1.0):
+    """Condition: R4 heater `channel` of `device` has had target as its set
+    point for settle_s seconds.
+
+    This is a timer, not a temperature check. The documented protocol has
+    no temperature readback: GA reports set points only. The condition
+    passes settle_s after GA first shows a set point within tolerance of
+    target, so settle_s has to cover the heater's heat-up time."""
+    confirmed_s = None
+
+    async def condition(orchestrator):
+        nonlocal confirmed_s
+        status = await orchestrator.devices[device].get_status()
+        set_points = getattr(status, "temperature_set_points", None) if getattr(status, "valid", False) else None
+        if set_points is None or channel >= len(set_points) or abs(set_points[channel] - target) > tolerance:
+            confirmed_s = None
+            return False
+        if confirmed_s is None:
+            confirmed_s = orchestrator.now()
+        return orchestrator.now() - confirmed_s >= settle_s
+    return condition
+
+def elapsed(seconds):
+    """Condition: the experiment clock has passed `seconds`."""
+    async def condition(orchestrator):
+        return orchestrator.now() >= seconds
+    return condition
+
+###############
+### Actions ###
+###############
+
+async def set_temperature(r4: AsyncR2Interface, channel, temperature):
+    await r4.stop()
+    await r4.start()
+    await r4.set_temp(channel, temperature)
+
+async def simple_flow_sweep(orchestrator, r2: AsyncR2Interface, F0_mL_per_min, F1_mL_per_min, pickup_vol_mL=4):
+    """new_code.flow.simple_flow_sweep on the experiment clock."""
+    await asyncio.gather(r2.switch_valve(1), r2.switch_valve(3))
+    await asyncio.gather(r2.set_flowrate(0, int(F0_mL_per_min * 1000)), r2.set_flowrate(1, int(F0_mL_per_min * 1000)))
+
+    pickup_time_s = pickup_vol_mL / F0_mL_per_min * 60
+    await orchestrator.sleep_until(orchestrator.now() + pickup_time_s)
+
+    await asyncio.gather(r2.set_flowrate(0, int(F1_mL_per_min * 1000)), r2.set_flowrate(1, int(F1_mL_per_min * 1000)))
+    await asyncio.gather(r2.switch_valve(0), r2.switch_valve(2))
+
+
+if __name__ == "__main__":
+
+    async def prime(r2s: AsyncR2Interface):
+        await r2s.stop()
+        await r2s.start()
+        await asyncio.gather(r2s.switch_valve(0), r2s.switch_valve(2))
+        await asyncio.gather(r2s.set_flowrate(0, 1000), r2s.set_flowrate(1, 1000))
+
+    async def main():
+        async with AsyncR2Interface("R2S") as r2s, AsyncR2Interface("R2") as r4:
+            orchestrator = Orchestrator({"R2S": r2s, "R4": r4})
+            orchestrator.step("heat", lambda o: set_temperature(o.devices["R4"], 3, 50))
+            orchestrator.step("prime", lambda o: prime(o.devices["R2S"]))
+            orchestrator.step(
+                "sweep",
+                lambda o: simple_flow_sweep(o, o.devices["R2S"], F0_mL_per_min=1, F1_mL_per_min=0.1, pickup_vol_mL=0.5),
+                after=["heat", "prime"],
+                when=set_point_settled("R4", 3, 50, settle_s=600),
+                timeout_s=1800,
+            )
+            try:
+                await orchestrator.run()
+            finally:
+                print(orchestrator.timeline())
+
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+"""
+Searches ramp designs for the widest residence time sweep per mL dispensed.
+
+"How to sweep the largest range of residence times with the smallest volume
+dispensed?" Each candidate is a power ramp (flow.ipynb / ramps.ramp_profile)
+described by its ramp shape, start and end flow, increment time, duration and
+reactor volume. Fluid entering during the ramp is scored by:
+
+    range_decades     log10(max / min) residence time covered
+    max_gap_decades   largest log10 gap between neighbouring residence times
+                      (the sweep's worst resolution, lower is denser)
+    volume_mL         reagent dispensed during the ramp
+    run_time_min      until the last reagent has left the reactor
+
+Candidates are evaluated in batches as 2D arrays (candidates x steps) and
+the batches are spread over a process pool. optimize() returns the Pareto
+front: no design on it is beaten on all four scores by another.
+
+    front = optimize(n_candidates=20000)
+    spec = to_spec(front.iloc[0])          # -> ramps.compile_ramp
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CANDIDATE_DTYPE = np.dtype([
+    ("ramp_shape", np.float64),
+    ("start_mL_min", np.float64),
+    ("end_mL_min", np.float64),
+    ("increment_time_s", np.float64),
+    ("duration_min", np.float64),
+    ("reactor_volume_mL", np.float64),
+])
+
+SCORE_COLUMNS = ["range_decades", "max_gap_decades", "volume_mL", "run_time_min", "min_residence_min", "max_residence_min"]
+
+# Objectives as (column, sign); sign -1 turns a maximized score into a minimized one
+OBJECTIVES = [("range_decades", -1), ("max_gap_decades", 1), ("volume_mL", 1), ("run_time_min", 1)]
+
+DEFAULT_BOUNDS = {
+    "ramp_shape": (0.0, 0.9),
+    "flow_mL_min": (0.01, 1.0),
+    "increment_time_s": (5.0, 60.0),
+    "duration_min": (5.0, 60.0),
+    "reactor_volume_mL": (2.0, 10.0),
+}
+
+##################
+### Candidates ###
+##################
+
+def sample_candidates(n, bounds=None, seed=None) -> np.ndarray:
+    """Random candidates. Flows are sampled log-uniformly, reactor volumes
+    from the two bound values (the 2 and 10 mL reactors)."""
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    if max(bounds["ramp_shape"]) >= 1:
+        raise ValueError(f"ramp_shape bounds must be below 1, got {bounds['ramp_shape']}.")
+    rng = np.random.default_rng(seed)
+    candidates = np.empty(n, dtype=CANDIDATE_DTYPE)
+
+    log_flow = np.log10(bounds["flow_mL_min"])
+    candidates["ramp_shape"] = rng.uniform(*bounds["ramp_shape"], n)
+    candidates["start_mL_min"] = 10 ** rng.uniform(*log_flow, n)
+    candidates["end_mL_min"] = 10 ** rng.uniform(*log_flow, n)
+    candidates["increment_time_s"] = rng.uniform(*bounds["increment_time_s"], n)
+    candidates["duration_min"] = rng.uniform(*bounds["duration_min"], n)
+    candidates["reactor_volume_mL"] = rng.choice(bounds["reactor_volume_mL"], n)
+    return candidates
+
+##################
+### Evaluation ###
+##################
+
+def evaluate_batch(candidates: np.ndarray) -> np.ndarray:
+    """Scores a batch of candidates. Returns an array with one row per
+    candidate and SCORE_COLUMNS as columns."""
+    n = len(candidates)
+    shape = candidates["ramp_shape"][:, None]
+    start = candidates["start_mL_min"][:, None]
+    end = candidates["end_mL_min"][:, None]
+    increment_min = candidates["increment_time_s"][:, None] / 60
+    duration_min = candidates["duration_min"][:, None]
+    reactor_volume = candidates["reactor_volume_mL"]
+
+    # Steps of the ramp; rows with fewer steps are padded by holding the
+    # last step's rate, which is what the pump does after the ramp anyway.
+    num_steps = np.rint(candidates["duration_min"] / candidates["increment_time_s"] * 60).astype(np.int64) + 1
+    max_steps = int(num_steps.max())
+    step = np.arange(max_steps)[None, :]
+    in_ramp = step < num_steps[:, None]
+
+    # ramps.ramp_profile("power", ...) for the whole batch at once
+    times = step * increment_min
+    x = np.clip(times / duration_min, 0, 1)
+    exponent = np.where(end > start, 1 / (1 - shape), 1 - shape)
+    rates = start + (end - start) * x ** exponent
+    last = num_steps - 1
+    rows = np.arange(n)
+    rates = np.where(in_ramp, rates, rates[rows, last][:, None])
+
+    # Cumulative volume at the start of each step
+    volumes = np.zeros((n, max_steps))
+    np.cumsum(rates[:, :-1] * increment_min, axis=1, out=volumes[:, 1:])
+
+    # Volume dispensed while the ramp runs (its last step lasts one increment)
+    ramp_volume = volumes[rows, last] + rates[rows, last] * increment_min[:, 0]
+
+    exit_times = _batched_time_at(times, rates, volumes, volumes + reactor_volume[:, None])
+    residence = exit_times - times
+    run_time = _batched_time_at(times, rates, volumes, (ramp_volume + reactor_volume)[:, None])[:, 0]
+
+    log_residence = np.where(in_ramp, np.log10(residence), np.nan)
+    min_log = np.nanmin(log_residence, axis=1)
+    max_log = np.nanmax(log_residence, axis=1)
+    sorted_log = np.sort(log_residence, axis=1)          # NaN padding sorts last
+    gaps = np.diff(sorted_log, axis=1)
+    max_gap = np.where(num_steps > 1, np.nanmax(np.where(np.isnan(gaps), -np.inf, gaps), axis=1), np.inf)
+
+    scores = np.empty((n, len(SCORE_COLUMNS)))
+    scores[:, 0] = max_log - min_log
+    scores[:, 1] = max_gap
+    scores[:, 2] = ramp_volume
+    scores[:, 3] = run_time
+    scores[:, 4] = 10 ** min_log
+    scores[:, 5] = 10 ** max_log
+    return scores
+
+def _batched_time_at(times, rates, volumes, targets):
+    """Row-wise first time at which each target volume is reached.
+
+    Every row is shifted by its own offset so the whole batch is one sorted
+    array and one searchsorted call. Targets past a row's last step are
+    extrapolated at that row's last rate."""
+    n, steps = volumes.shape
+    spacing = max(volumes[:, -1].max(), np.nanmax(targets)) + 1.0
+    offsets = np.arange(n)[:, None] * spacing
+
+    flat_volumes = (volumes + offsets).ravel()
+    flat_targets = (targets + offsets).ravel()
+    idx = np.searchsorted(flat_volumes, flat_targets, side="left") - 1
+
+    # Keep idx inside its own row (a target equal to the row start maps to it)
+    row_start = np.repeat(np.arange(n) * steps, targets.shape[1])
+    idx = np.clip(idx, row_start, row_start + steps - 1)
+
+    # Interpolate on the unshifted values so the offsets cost no precision
+    result = times.ravel()[idx] + (targets.ravel() - volumes.ravel()[idx]) / rates.ravel()[idx]
+    return result.reshape(targets.shape)
+
+##############
+### Pareto ###
+##############
+
+def pareto_mask(objectives: np.ndarray) -> np.ndarray:
+    """True for rows not dominated by any other row (all objectives minimized).
+
+    Rows are visited in lexicographic order. A row can only be dominated by
+    one that sorts before it, so each row is checked against the front
+    found so far."""
+    n, m = objectives.shape
+    front = np.empty((n, m))
+    size = 0
+    keep = np.zeros(n, dtype=bool)
+    for i in np.lexsort(objectives.T[::-1]):
+        point = objectives[i]
+        current = front[:size]
+        dominated = np.any(np.all(current <= point, axis=1) & np.any(current < point, axis=1))
+        if not dominated:
+            front[size] = point
+            size += 1
+            keep[i] = True
+    return keep
+
+def optimize(
+    n_candidates=20000,
+    bounds=None,
+    batch_size=500,
+    workers=None,
+    max_run_time_min=None,
+    min_range_decades=None,
+    seed=None,
+) -> pd.DataFrame:
+    """Samples and scores candidates in parallel and returns the Pareto front,
+    sorted by volume. Candidates outside the run time / range constraints are
+    dropped before the front is taken."""
+    candidates = sample_candidates(n_candidates, bounds, seed)
+    batches = [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
+
+    if workers == 1:
+        scores = [evaluate_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scores = list(executor.map(evaluate_batch, batches))
+
+    results = pd.DataFrame(candidates)
+    results[SCORE_COLUMNS] = np.concatenate(scores)
+    results = results[np.isfinite(results[SCORE_COLUMNS]).all(axis=1)]
+    if max_run_time_min is not None:
+        results = results[results["run_time_min"] <= max_run_time_min]
+    if min_range_decades is not None:
+        results = results[results["range_decades"] >= min_range_decades]
+
+    objectives = np.column_stack([sign * results[column].to_numpy() for column, sign in OBJECTIVES])
+    front = results[pareto_mask(objectives)]
+    return front.sort_values("volume_mL").reset_index(drop=True)
+
+def to_spec(candidate, pump=0) -> dict:
+    """ramps.compile_ramp spec for one candidate (a front row)."""
+    return {
+        "increment_time_s": float(candidate["increment_time_s"]),
+        "pumps": {
+            pump: {
+                "shape": "power",
+                "start": float(candidate["start_mL_min"]),
+                "end": float(candidate["end_mL_min"]),
+                "duration_min": float(candidate["duration_min"]),
+                "ramp_shape": float(candidate["ramp_shape"]),
+            },
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pareto front of flow rate ramp designs.")
+    parser.add_argument("-n", "--candidates", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-run-time", type=float, default=None, help="min")
+    parser.add_argument("--min-range", type=float, default=None, help="decades of residence time")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="CSV path for the front")
+    args = parser.parse_args()
+
+    front = optimize(
+        n_candidates=args.candidates,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_run_time_min=args.max_run_time,
+        min_range_decades=args.min_range,
+        seed=args.seed,
+    )
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 3):
+        print(f"Pareto front: {len(front)} of {args.candidates} candidates")
+        print(front)
+    if args.output:
+        front.to_csv(args.output, index=False)
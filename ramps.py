@@ -0,0 +1,152 @@
+"""
+Flow rate ramp trajectories compiled into command schedules.
+
+A ramp is described declaratively and compiled into a NumPy structured array
+of timed actions that scheduler.DeadlineScheduler can run:
+
+    spec = {
+        "increment_time_s": 15,
+        "pumps": {
+            0: {"shape": "power", "start": 1.0, "end": 0.1, "duration_min": 10,
+                "ramp_shape": 0.4, "hold_s": 60},
+        },
+        "valves": [(0, 1), (675, 0)],      # (time s, valve id)
+    }
+    schedule = compile_ramp(spec)
+    add_to_scheduler(schedule, r2, scheduler)
+
+Pump flow rates are given in mL/min and scheduled in uL/min, rounded to the
+pump resolution. Steps that would resend the same rate are dropped.
+
+Shapes:
+    power      the notebook's ramp_shape curve, 0 = linear, -> 1 = sharper
+    linear     straight line from start to end
+    log        geometric, equal ratios per step (good for residence time sweeps)
+    piecewise  linear between "times_min" / "rates" breakpoints
+"""
+
+import numpy as np
+
+SCHEDULE_DTYPE = np.dtype([
+    ("time_s", np.float64),
+    ("pump", np.int8),          # -1 for valve actions
+    ("rate_uL_min", np.int32),
+    ("valve", np.int8),         # -1 for flow rate actions
+])
+
+RAMP_SHAPES = ["power", "linear", "log", "piecewise"]
+
+def ramp_profile(
+    shape: str,
+    time_min: np.ndarray,
+    duration_min: float,
+    start: float = 0.0,
+    end: float = 0.0,
+    ramp_shape: float = 0.0,
+    times_min=None,
+    rates=None,
+) -> np.ndarray:
+    """Flow rate (mL/min) at each time (min from ramp start), held at the
+    end value after duration_min."""
+
+    x = np.clip(np.asarray(time_min, dtype=np.float64) / duration_min, 0, 1)
+
+    if shape == "linear":
+        return start + (end - start) * x
+    if shape == "power":
+        if ramp_shape >= 1:
+            raise ValueError(f"ramp_shape must be below 1, got {ramp_shape}.")
+        if end > start:
+            ramp = x ** (1 / (1 - ramp_shape))
+        else:
+            ramp = x ** (1 - ramp_shape)
+        return start + (end - start) * ramp
+    if shape == "log":
+        if start <= 0 or end <= 0:
+            raise ValueError("Log ramps need start and end flow rates above zero.")
+        return start * (end / start) ** x
+    if shape == "piecewise":
+        if times_min is None or rates is None:
+            raise ValueError("Piecewise ramps need 'times_min' and 'rates'.")
+        return np.interp(time_min, times_min, rates)
+
+    raise ValueError(f"Invalid ramp shape: {shape}. Must be one of {RAMP_SHAPES}.")
+
+def compile_pump(pump: int, pump_spec: dict, increment_time_s: float, resolution_uL_min: int = 1) -> np.ndarray:
+    """Schedule of FR actions for one pump."""
+    shape = pump_spec.get("shape", "linear")
+    start_s = pump_spec.get("start_s", 0.0)
+    hold_s = pump_spec.get("hold_s", 0.0)
+    if shape == "piecewise":
+        duration_min = pump_spec.get("duration_min", pump_spec["times_min"][-1])
+    else:
+        duration_min = pump_spec["duration_min"]
+
+    num_increments = int(round(duration_min * 60 / increment_time_s)) + 1
+    step_times_s = np.arange(num_increments) * float(increment_time_s)
+    rates_mL_min = ramp_profile(
+        shape,
+        step_times_s / 60,
+        duration_min,
+        start=pump_spec.get("start", 0.0),
+        end=pump_spec.get("end", 0.0),
+        ramp_shape=pump_spec.get("ramp_shape", 0.0),
+        times_min=pump_spec.get("times_min"),
+        rates=pump_spec.get("rates"),
+    )
+
+    # The pump holds its first rate during hold_s before the ramp starts
+    if hold_s > 0:
+        step_times_s = np.concatenate(([0.0], step_times_s + hold_s))
+        rates_mL_min = np.concatenate((rates_mL_min[:1], rates_mL_min))
+
+    rates_uL_min = (np.rint(rates_mL_min * 1000 / resolution_uL_min) * resolution_uL_min).astype(np.int32)
+    keep = np.empty(len(rates_uL_min), dtype=bool)
+    keep[0] = True
+    np.not_equal(rates_uL_min[1:], rates_uL_min[:-1], out=keep[1:])
+
+    schedule = np.empty(int(keep.sum()), dtype=SCHEDULE_DTYPE)
+    schedule["time_s"] = start_s + step_times_s[keep]
+    schedule["pump"] = pump
+    schedule["rate_uL_min"] = rates_uL_min[keep]
+    schedule["valve"] = -1
+    return schedule
+
+def compile_ramp(spec: dict) -> np.ndarray:
+    """Compiles a ramp spec into one schedule sorted by time.
+
+    At equal times valve switches come before flow rate changes."""
+    increment_time_s = spec.get("increment_time_s", 15)
+    resolution_uL_min = spec.get("resolution_uL_min", 1)
+
+    parts = [
+        compile_pump(int(pump), pump_spec, increment_time_s, resolution_uL_min)
+        for pump, pump_spec in spec.get("pumps", {}).items()
+    ]
+
+    valves = spec.get("valves", [])
+    valve_actions = np.empty(len(valves), dtype=SCHEDULE_DTYPE)
+    if valves:
+        valve_times, valve_ids = zip(*valves)
+        valve_actions["time_s"] = valve_times
+        valve_actions["pump"] = -1
+        valve_actions["rate_uL_min"] = 0
+        valve_actions["valve"] = valve_ids
+    parts.append(valve_actions)
+
+    schedule = np.concatenate(parts)
+    is_flow = schedule["valve"] < 0
+    order = np.lexsort((schedule["pump"], is_flow, schedule["time_s"]))
+    return schedule[order]
+
+def add_to_scheduler(schedule: np.ndarray, interface, scheduler, start_s: float = 0.0):
+    """Plans a compiled schedule on a DeadlineScheduler.
+
+    Works with flow.R2Interface (set_flowrate) and new_code R2Interface (SetFlowRate)."""
+    for time_s, pump, rate, valve in schedule.tolist():
+        if valve >= 0:
+            scheduler.at(start_s + time_s, interface.switch_valve, valve)
+        elif hasattr(interface, "set_flowrate"):
+            scheduler.at(start_s + time_s, interface.set_flowrate, pump, rate)
+        else:
+            scheduler.at(start_s + time_s, interface.SetFlowRate, rate, pump)
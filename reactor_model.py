@@ -0,0 +1,222 @@
+"""
+Residence time distributions and FFT convolution of sensor traces.
+
+The analysis readers treat the reactor as ideal plug flow: every signal is
+moved back by a fixed apply_time_shift(shift_min=7). A real coil also spreads
+a step out over time. This module builds the residence time distribution
+(RTD) E(t) of reactor + tubing at a given flow. It uses either the axial
+dispersion model (Taylor-Aris dispersion in laminar tube flow) or N tanks
+in series. A trace is then convolved with E(t) (predict what the detector
+sees) or deconvolved (recover what left the pumps), using FFTs.
+
+Everything is batched over flow rates: pass an array of flows and get one
+RTD row per flow, then (de)convolve one trace per row in a single call.
+
+    t = np.arange(4096) * dt_min
+    rtd = residence_time_distribution(t, reactor_volume_mL=2, tubing_volume_mL=0.3,
+                                      flow_mL_min=[0.1, 0.5, 1.0])
+    smeared = convolve(inlet_steps, rtd, dt_min)
+    corrected = deconvolve(uv_traces, rtd, dt_min)
+
+Traces must be on a uniform time grid; resample() puts UV-Vis, IR and NMR
+data (analysis.TIME_KEY frames) on one.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+from analysis import TIME_KEY
+
+RTD_MODELS = ["dispersion", "tanks"]
+
+#################
+### Transport ###
+#################
+
+def taylor_aris_peclet(
+    volume_mL,
+    flow_mL_min,
+    inner_diameter_mm: float = 1.0,
+    diffusivity_m2_s: float = 1e-9,
+):
+    """Peclet number u L / D_ax of laminar flow in a tube.
+
+    D_ax = D_m + u^2 d^2 / (192 D_m) (Taylor-Aris). The Vapourtec coils are
+    1 mm ID PFA, small molecules in THF diffuse at about 1e-9 m^2/s."""
+    flow_m3_s = np.asarray(flow_mL_min, dtype=np.float64) * 1e-6 / 60
+    volume_m3 = np.asarray(volume_mL, dtype=np.float64) * 1e-6
+    diameter_m = inner_diameter_mm * 1e-3
+    area_m2 = np.pi * diameter_m ** 2 / 4
+
+    velocity = flow_m3_s / area_m2
+    length = volume_m3 / area_m2
+    dispersion = diffusivity_m2_s + velocity ** 2 * diameter_m ** 2 / (192 * diffusivity_m2_s)
+    return velocity * length / dispersion
+
+def _open_vessel_moments(peclet):
+    # Mean and variance of the open-open E(theta) in units of tau (Levenspiel)
+    return 1 + 2 / peclet, 2 / peclet + 8 / peclet ** 2
+
+def tanks_for_peclet(peclet):
+    """Tanks-in-series count with the same relative variance as dispersion_rtd.
+
+    Both models use the open-open vessel: 1/N = sigma^2 / mean^2 with
+    mean = 1 + 2/Pe and sigma^2 = 2/Pe + 8/Pe^2 (Levenspiel)."""
+    peclet = np.asarray(peclet, dtype=np.float64)
+    mean, variance = _open_vessel_moments(peclet)
+    return mean ** 2 / variance
+
+############
+### RTDs ###
+############
+
+def dispersion_rtd(t_min, mean_residence_min, peclet):
+    """Axial dispersion RTD E(t) in 1/min (open-open vessel).
+
+    The open-open E(theta) has mean tau (1 + 2/Pe); time is rescaled so the
+    mean is mean_residence_min, as for the tanks model and plug flow.
+    t_min is (n_t,); mean_residence_min and peclet broadcast against each
+    other and give the leading (batch) dimensions."""
+    t = np.asarray(t_min, dtype=np.float64)
+    peclet = np.asarray(peclet, dtype=np.float64)[..., None]
+    mean, _ = _open_vessel_moments(peclet)
+    tau = np.asarray(mean_residence_min, dtype=np.float64)[..., None] / mean
+
+    theta = t / tau
+    with np.errstate(divide="ignore", invalid="ignore"):
+        e_theta = np.sqrt(peclet / (4 * np.pi * theta)) * np.exp(-peclet * (1 - theta) ** 2 / (4 * theta))
+    return np.where(theta > 0, e_theta, 0.0) / tau
+
+def tanks_rtd(t_min, mean_residence_min, n_tanks):
+    """Tanks-in-series RTD E(t) in 1/min. n_tanks need not be an integer."""
+    t = np.asarray(t_min, dtype=np.float64)
+    tau = np.asarray(mean_residence_min, dtype=np.float64)[..., None]
+    n = np.asarray(n_tanks, dtype=np.float64)[..., None]
+
+    with np.errstate(divide="ignore"):
+        log_e = n * np.log(n / tau) + (n - 1) * np.log(t) - n * t / tau - gammaln(n)
+    return np.where(t > 0, np.exp(log_e), 0.0)
+
+def residence_time_distribution(
+    t_min,
+    reactor_volume_mL: float,
+    flow_mL_min,
+    tubing_volume_mL: float = 0.0,
+    model: str = "dispersion",
+    peclet=None,
+    n_tanks=None,
+    inner_diameter_mm: float = 1.0,
+    diffusivity_m2_s: float = 1e-9,
+) -> np.ndarray:
+    """Discrete RTD of reactor + tubing on the grid t_min, one row per flow.
+
+    Rows are normalized to sum(E) * dt = 1 so convolution conserves mass.
+    Without peclet / n_tanks they follow from Taylor-Aris dispersion in
+    the total volume."""
+    if model not in RTD_MODELS:
+        raise ValueError(f"Invalid RTD model: {model}. Must be one of {RTD_MODELS}.")
+
+    t = np.asarray(t_min, dtype=np.float64)
+    flow = np.atleast_1d(np.asarray(flow_mL_min, dtype=np.float64))
+    volume = reactor_volume_mL + tubing_volume_mL
+    tau = volume / flow
+
+    if peclet is None:
+        peclet = taylor_aris_peclet(volume, flow, inner_diameter_mm, diffusivity_m2_s)
+    if model == "dispersion":
+        rtd = dispersion_rtd(t, tau, peclet)
+    else:
+        rtd = tanks_rtd(t, tau, tanks_for_peclet(peclet) if n_tanks is None else n_tanks)
+
+    dt = t[1] - t[0]
+    area = rtd.sum(axis=-1, keepdims=True) * dt
+    return rtd / np.where(area > 0, area, 1.0)
+
+###################
+### Convolution ###
+###################
+
+def _fft_size(n):
+    # Zero padding to 2n avoids wrap-around; a power of two keeps the FFT fast
+    return 1 << int(np.ceil(np.log2(2 * n)))
+
+def convolve(signal, rtd, dt_min: float) -> np.ndarray:
+    """Outlet signal for an inlet signal: (signal * E)(t) dt, same length.
+
+    signal and rtd broadcast over their leading dimensions, e.g. one inlet
+    against many flows, or one trace per flow."""
+    signal = np.asarray(signal, dtype=np.float64)
+    rtd = np.asarray(rtd, dtype=np.float64)
+    n = signal.shape[-1]
+    size = _fft_size(max(n, rtd.shape[-1]))
+
+    # Hold the first value before t=0 so an offset baseline is not read as a step
+    baseline = signal[..., :1]
+    spectrum = np.fft.rfft(signal - baseline, size) * np.fft.rfft(rtd, size) * dt_min
+    return np.fft.irfft(spectrum, size)[..., :n] + baseline
+
+def deconvolve(signal, rtd, dt_min: float, regularization: float = 1e-2) -> np.ndarray:
+    """Inlet signal that produced a measured outlet signal (Wiener filter).
+
+    regularization damps frequencies where the RTD has little power (noise
+    would otherwise be amplified), relative to the RTD's peak power."""
+    signal = np.asarray(signal, dtype=np.float64)
+    rtd = np.asarray(rtd, dtype=np.float64)
+    n = signal.shape[-1]
+    size = _fft_size(max(n, rtd.shape[-1]))
+
+    # Taper from the last value back to the baseline over the padding, so
+    # the FFT's periodic extension has no step where the end wraps to t=0
+    baseline = signal[..., :1]
+    pad = size - n
+    taper = 0.5 * (1 + np.cos(np.pi * np.arange(1, pad + 1) / (pad + 1)))
+    padded = np.concatenate([signal - baseline, (signal[..., -1:] - baseline) * taper], axis=-1)
+    transfer = np.fft.rfft(rtd, size) * dt_min
+    power = np.abs(transfer) ** 2
+    noise = regularization * power.max(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(padded, size) * np.conj(transfer) / (power + noise)
+    return np.fft.irfft(spectrum, size)[..., :n] + baseline
+
+###################
+### Sensor data ###
+###################
+
+def resample(data: pd.DataFrame, dt_min: float, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Linear interpolation of TIME_KEY data frames onto a uniform grid."""
+    if columns is None:
+        columns = [c for c in data.columns if c != TIME_KEY]
+    data = data.sort_values(TIME_KEY)
+    times = data[TIME_KEY].to_numpy(dtype=np.float64)
+    grid = np.arange(times[0], times[-1] + dt_min / 2, dt_min)
+
+    resampled = {TIME_KEY: grid}
+    for column in columns:
+        resampled[column] = np.interp(grid, times, data[column].to_numpy(dtype=np.float64))
+    return pd.DataFrame(resampled)
+
+def correct_trace(
+    data: pd.DataFrame,
+    columns: Sequence[str],
+    reactor_volume_mL: float,
+    flow_mL_min: float,
+    dt_min: Optional[float] = None,
+    regularization: float = 1e-2,
+    **rtd_kwargs,
+) -> pd.DataFrame:
+    """Deconvolves the given columns of a UV-Vis / IR / NMR frame.
+
+    The frame should not have been time shifted; the RTD already contains
+    the transport delay. Returns a frame on a uniform grid (dt_min defaults
+    to the median sample spacing)."""
+    if dt_min is None:
+        dt_min = float(np.median(np.diff(np.sort(data[TIME_KEY].to_numpy()))))
+    uniform = resample(data, dt_min, columns)
+    t = np.arange(len(uniform)) * dt_min
+    rtd = residence_time_distribution(t, reactor_volume_mL, flow_mL_min, **rtd_kwargs)[0]
+
+    traces = uniform[list(columns)].to_numpy().T
+    uniform[list(columns)] = deconvolve(traces, rtd, dt_min, regularization).T
+    return uniform
@@ -0,0 +1,176 @@
+"""
+Residence and collection times for arbitrary flow histories.
+
+A flow history is piecewise constant. Each rate in `rates_mL_min` applies from
+its change time until the next one, and the last rate holds from then on.
+The history may be planned (ramps.compile_ramp) or logged (SystemMonitor
+readbacks). Integrating it once gives the cumulative volume V(t) at every
+change. V(t) at any time, and its inverse t(V), are then one searchsorted
+per query. No per-step Python loop or interp1d is involved.
+
+    history = flow_history_from_schedule(compile_ramp(spec))
+    times = residence_times(*history, uv_data[TIME_KEY], reactor_volume_mL=2, dead_volume_mL=0.3)
+    uv_data = uv_data.join(times.drop(columns=TIME_KEY))
+
+For a fluid element seen at the detector at time t:
+    left reactor   when V = V(t) - dead volume
+    entered        when V = V(t) - dead volume - reactor volume
+    residence time = left - entered
+The result is NaN until the first fluid that has been through the whole
+reactor reaches the detector.
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis import TIME_KEY
+
+RESIDENCE_TIME_KEY = "Residence Time [min]"
+ENTRY_TIME_KEY = "Reactor Entry Time [min]"
+EXIT_TIME_KEY = "Reactor Exit Time [min]"
+VOLUME_KEY = "Cumulative Volume [mL]"
+
+def _history(change_times_min, rates_mL_min) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Validated change times, total rates and cumulative volume at each change.
+
+    2D rates (steps x pumps) are summed, since all pumps feed the reactor."""
+    change_times_min = np.asarray(change_times_min, dtype=np.float64)
+    rates_mL_min = np.asarray(rates_mL_min, dtype=np.float64)
+    if rates_mL_min.ndim == 2:
+        rates_mL_min = rates_mL_min.sum(axis=1)
+    if change_times_min.shape != rates_mL_min.shape or change_times_min.ndim != 1:
+        raise ValueError("Need one flow rate (or row of pump rates) per change time.")
+    if len(change_times_min) == 0:
+        raise ValueError("Flow history is empty.")
+    if np.any(np.diff(change_times_min) < 0):
+        raise ValueError("Change times must be sorted.")
+    if np.any(rates_mL_min < 0):
+        raise ValueError("Flow rates must not be negative.")
+
+    node_volumes = np.empty(len(change_times_min))
+    node_volumes[0] = 0.0
+    np.cumsum(rates_mL_min[:-1] * np.diff(change_times_min), out=node_volumes[1:])
+    return change_times_min, rates_mL_min, node_volumes
+
+def cumulative_volume(change_times_min, rates_mL_min, times_min) -> np.ndarray:
+    """Volume dispensed (mL) from the first change time up to each time."""
+    change_times_min, rates_mL_min, node_volumes = _history(change_times_min, rates_mL_min)
+    return _volume_at(change_times_min, rates_mL_min, node_volumes, np.asarray(times_min, dtype=np.float64))
+
+def time_at_volume(change_times_min, rates_mL_min, volumes_mL) -> np.ndarray:
+    """First time (min) at which each cumulative volume is reached.
+
+    NaN for negative volumes and for volumes the history never reaches."""
+    change_times_min, rates_mL_min, node_volumes = _history(change_times_min, rates_mL_min)
+    return _time_at(change_times_min, rates_mL_min, node_volumes, np.asarray(volumes_mL, dtype=np.float64))
+
+# _volume_at and _time_at take scalars too and then return a scalar
+
+def _volume_at(change_times_min, rates_mL_min, node_volumes, times_min):
+    shape = np.shape(times_min)
+    times_min = np.atleast_1d(times_min)
+    idx = np.searchsorted(change_times_min, times_min, side="right") - 1
+    before_start = idx < 0
+    idx = np.maximum(idx, 0)
+    volumes = node_volumes[idx] + rates_mL_min[idx] * (times_min - change_times_min[idx])
+    volumes[before_start] = 0.0
+    return volumes.reshape(shape)[()]
+
+def _time_at(change_times_min, rates_mL_min, node_volumes, volumes_mL):
+    # Segment idx is the one during which V passes v: V[idx] < v <= V[idx + 1].
+    # Its rate is > 0, so the division is safe except past the end of the history.
+    shape = np.shape(volumes_mL)
+    volumes_mL = np.atleast_1d(volumes_mL)
+    idx = np.searchsorted(node_volumes, volumes_mL, side="left") - 1
+    at_start = idx < 0
+    idx = np.maximum(idx, 0)
+    rates = rates_mL_min[idx]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        times = change_times_min[idx] + (volumes_mL - node_volumes[idx]) / rates
+    times[at_start] = change_times_min[0]
+    times[(volumes_mL < 0) | ~np.isfinite(times)] = np.nan
+    return times.reshape(shape)[()]
+
+def residence_times(
+    change_times_min,
+    rates_mL_min,
+    sample_times_min,
+    reactor_volume_mL: float,
+    dead_volume_mL: float = 0.0,
+) -> pd.DataFrame:
+    """True residence time of the fluid reaching the detector at each sample time.
+
+    Returns a DataFrame with TIME_KEY (the sample times) and the reactor
+    entry/exit times, residence time and cumulative volume. Its index
+    matches the samples, so it can be joined onto sensor data directly."""
+    change_times_min, rates_mL_min, node_volumes = _history(change_times_min, rates_mL_min)
+    sample_times = np.atleast_1d(np.asarray(sample_times_min, dtype=np.float64))
+
+    detector_volumes = _volume_at(change_times_min, rates_mL_min, node_volumes, sample_times)
+    exit_volumes = detector_volumes - dead_volume_mL
+    entry_volumes = exit_volumes - reactor_volume_mL
+    exit_times = _time_at(change_times_min, rates_mL_min, node_volumes, exit_volumes)
+    entry_times = _time_at(change_times_min, rates_mL_min, node_volumes, entry_volumes)
+
+    return pd.DataFrame(
+        {
+            TIME_KEY: sample_times,
+            ENTRY_TIME_KEY: entry_times,
+            EXIT_TIME_KEY: exit_times,
+            RESIDENCE_TIME_KEY: exit_times - entry_times,
+            VOLUME_KEY: detector_volumes,
+        },
+        index=sample_times_min.index if isinstance(sample_times_min, pd.Series) else None,
+    )
+
+def collection_times(
+    change_times_min,
+    rates_mL_min,
+    entry_times_min,
+    reactor_volume_mL: float,
+    dead_volume_mL: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Forward direction (the notebook's collection_time_min).
+
+    For fluid entering the reactor at each time, returns (time it reaches the
+    detector, residence time in the reactor)."""
+    change_times_min, rates_mL_min, node_volumes = _history(change_times_min, rates_mL_min)
+    entry_volumes = _volume_at(change_times_min, rates_mL_min, node_volumes, np.asarray(entry_times_min, dtype=np.float64))
+    exit_times = _time_at(change_times_min, rates_mL_min, node_volumes, entry_volumes + reactor_volume_mL)
+    detector_times = _time_at(change_times_min, rates_mL_min, node_volumes, entry_volumes + reactor_volume_mL + dead_volume_mL)
+    return detector_times, exit_times - np.asarray(entry_times_min, dtype=np.float64)
+
+######################
+### Flow histories ###
+######################
+
+def flow_history_from_schedule(schedule: np.ndarray, pumps=None) -> Tuple[np.ndarray, np.ndarray]:
+    """(change times in min, total rate in mL/min) from a ramps.compile_ramp schedule.
+
+    Pumps hold 0 until their first FR action."""
+    flow = schedule[schedule["valve"] < 0]
+    if pumps is None:
+        pumps = np.unique(flow["pump"])
+
+    change_times_s = np.unique(flow["time_s"])
+    total_uL_min = np.zeros(len(change_times_s))
+    for pump in pumps:
+        actions = flow[flow["pump"] == pump]
+        if len(actions) == 0:
+            continue
+        # Rate of this pump in force at each change time (last action at or before it)
+        idx = np.searchsorted(actions["time_s"], change_times_s, side="right") - 1
+        rates = actions["rate_uL_min"][np.maximum(idx, 0)].astype(np.float64)
+        rates[idx < 0] = 0.0
+        total_uL_min += rates
+
+    return change_times_s / 60, total_uL_min / 1000
+
+def flow_history_from_status(times_s, pump_a_uL_min, pump_b_uL_min) -> Tuple[np.ndarray, np.ndarray]:
+    """(change times in min, total rate in mL/min) from logged GA readbacks
+    (e.g. SystemMonitor.status_log columns). Each reading holds until the next."""
+    times_s = np.asarray(times_s, dtype=np.float64)
+    total_uL_min = np.asarray(pump_a_uL_min, dtype=np.float64) + np.asarray(pump_b_uL_min, dtype=np.float64)
+    return (times_s - times_s[0]) / 60, total_uL_min / 1000
@@ -0,0 +1,231 @@
+"""
+Content-addressed cache for processed instrument data.
+
+A result is stored under a key made from everything it depends on: the
+size and mtime (optionally a content hash) of every input file, the reader
+kwargs and the source code of the reader itself. Changing a file, a
+wavelength map or the reader therefore gives a new key, and nothing has to
+be invalidated by hand.
+
+Results are pickled to <directory>/<key>.pkl. The most recently used ones
+are also kept in memory. When the directory grows past max_bytes, the
+least recently used files are deleted (a hit refreshes the file's mtime).
+
+    cache = ResultCache("Processed/.cache")
+    key = cache.key("UV_Vis", fingerprint([uv_path]), uv_kwargs)
+    hit, data = cache.get(key)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+MISSING = object()
+
+def fingerprint(paths, hash_contents=False, skip_dirs=(".sidecar", ".cache")):
+    """(path, size, mtime_ns[, sha1]) for every file under paths.
+
+    Directories are walked; paths that do not exist are recorded as missing
+    so that creating them changes the fingerprint."""
+    entries = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d not in skip_dirs)
+                for name in sorted(files):
+                    entries.append(_file_entry(os.path.join(root, name), hash_contents))
+        elif os.path.exists(path):
+            entries.append(_file_entry(path, hash_contents))
+        else:
+            entries.append((path, "missing"))
+    return entries
+
+def _file_entry(path, hash_contents):
+    stat = os.stat(path)
+    entry = (path, stat.st_size, stat.st_mtime_ns)
+    if hash_contents:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        entry += (digest.hexdigest(),)
+    return entry
+
+def write_text_if_changed(path, text):
+    """Writes text to path only if the file does not already contain it."""
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            if f.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    return True
+
+class ResultCache:
+
+    def __init__(self, directory, max_bytes=256 * 2**20, memory_items=32):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._outputs = None
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """Returns (hit, value)."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return True, self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            # Missing, truncated, or written by other library versions
+            # (AttributeError, ModuleNotFoundError, ...): recompute
+            self.misses += 1
+            return False, MISSING
+
+        self._remember(key, value)
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+        except Exception:
+            # Unwritable directory or unpicklable value: keep it in memory only
+            return
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        hit, value = self.get(key)
+        if not hit:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits max_bytes."""
+        try:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    ###############
+    ### Outputs ###
+    ###############
+
+    def write_if_changed(self, path, key, render):
+        """Writes render() (text) to path unless it would not change the file.
+
+        If path was last written by this cache for the same key and is
+        untouched since, nothing is rendered at all. Otherwise the text is
+        compared with the file and only written when it differs. Returns
+        True if the file was written."""
+        outputs = self._load_outputs()
+        name = os.path.abspath(path)
+        recorded = outputs.get(name)
+        try:
+            stat = os.stat(path)
+            current = [key, stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            current = None
+        if recorded is not None and recorded == current:
+            return False
+
+        written = write_text_if_changed(path, render())
+        stat = os.stat(path)
+        outputs[name] = [key, stat.st_size, stat.st_mtime_ns]
+        self._save_outputs()
+        return written
+
+    def _outputs_path(self):
+        return os.path.join(self.directory, "outputs.json")
+
+    def _load_outputs(self):
+        if self._outputs is None:
+            try:
+                with open(self._outputs_path()) as f:
+                    self._outputs = json.load(f)
+            except (OSError, ValueError):
+                self._outputs = {}
+        return self._outputs
+
+    def _save_outputs(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._outputs, f)
+            os.replace(tmp_path, self._outputs_path())
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+    def __str__(self):
+        return f"Result Cache: {self.directory}, Hits={self.hits}, Misses={self.misses}"
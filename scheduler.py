@@ -0,0 +1,154 @@
+"""
+Deadline scheduler for timed experiment actions.
+
+Actions are planned at offsets from a single time.monotonic() start, not
+after the previous action finished. Serial latency and printing therefore
+delay only the action they belong to, and never push back the rest of the
+schedule. Each device gets its own worker thread. Actions due at the same
+instant on different devices fire together; actions on one device keep
+their order.
+
+    scheduler = DeadlineScheduler()
+    scheduler.at(0, r2s.switch_valve, 1)
+    for t_s, rate in zip(times_s, rates):
+        scheduler.at(t_s, r2s.SetFlowRate, rate, 0)
+    scheduler.at(0, r4.set_temp, 3, 50)
+    scheduler.run()
+    print(scheduler.report())
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class ScheduledAction:
+
+    __slots__ = ("offset_s", "device", "label", "func", "args", "kwargs")
+
+    def __init__(self, offset_s, device, label, func, args, kwargs):
+        self.offset_s = offset_s
+        self.device = device
+        self.label = label
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+class DeadlineScheduler:
+
+    def __init__(self, spin_s=0.002, stop_on_error=True, verbose=False):
+        """
+        spin_s: the last part of each wait is spent polling the clock instead
+            of sleeping, since sleep() can overshoot by a few milliseconds.
+        stop_on_error: abort the remaining schedule if an action raises
+            (e.g. flow.InterlockError after an interlock trip).
+        """
+        self.spin_s = spin_s
+        self.stop_on_error = stop_on_error
+        self.verbose = verbose
+
+        self.actions = []
+        self.log = []
+        self.start_time = None
+
+        self._log_lock = threading.Lock()
+        self._abort = threading.Event()
+
+    def at(self, offset_s, func, *args, device=None, label=None, **kwargs):
+        """Plans func(*args, **kwargs) at offset_s seconds after the start.
+
+        device defaults to the object a bound method belongs to, so calls on
+        one interface run in order and calls on different interfaces overlap."""
+        if device is None:
+            device = getattr(func, "__self__", None)
+        if label is None:
+            call_args = " ".join(str(arg) for arg in args)
+            label = f"{getattr(func, '__name__', repr(func))} {call_args}".strip()
+        self.actions.append(ScheduledAction(float(offset_s), device, label, func, args, kwargs))
+
+    def stop(self):
+        """Skips every action that has not started yet."""
+        self._abort.set()
+
+    @property
+    def duration_s(self):
+        return max((action.offset_s for action in self.actions), default=0.0)
+
+    def run(self, start_time=None):
+        """Runs the schedule and blocks until every action finished.
+        Returns the log of planned vs actual times."""
+        self._abort.clear()
+        self.log = []
+        actions = sorted(self.actions, key=lambda action: action.offset_s)
+
+        devices = {id(action.device) for action in actions}
+        executors = {
+            device: ThreadPoolExecutor(max_workers=1, thread_name_prefix="scheduler")
+            for device in devices
+        }
+
+        self.start_time = time.monotonic() if start_time is None else start_time
+        try:
+            futures = []
+            for action in actions:
+                if not self._wait_until(self.start_time + action.offset_s):
+                    break
+                futures.append(executors[id(action.device)].submit(self._fire, action))
+            for future in futures:
+                future.result()
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+        return self.log
+
+    def _wait_until(self, deadline):
+        """Sleeps until the deadline; returns False if the schedule was stopped."""
+        while True:
+            if self._abort.is_set():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            if remaining > self.spin_s:
+                self._abort.wait(remaining - self.spin_s)
+
+    def _fire(self, action):
+        if self._abort.is_set():
+            return
+
+        planned = self.start_time + action.offset_s
+        started = time.monotonic()
+        error = None
+        try:
+            result = action.func(*action.args, **action.kwargs)
+        except Exception as e:
+            result, error = None, e
+            if self.stop_on_error:
+                self._abort.set()
+        finished = time.monotonic()
+
+        entry = {
+            "label": action.label,
+            "planned_s": action.offset_s,
+            "actual_s": started - self.start_time,
+            "late_s": started - planned,
+            "duration_s": finished - started,
+            "result": result,
+            "error": error,
+        }
+        with self._log_lock:
+            self.log.append(entry)
+        if self.verbose:
+            print(f"{entry['planned_s']:9.3f} s  (+{entry['late_s'] * 1000:6.1f} ms)  {action.label}")
+
+    def report(self):
+        """Lateness summary of the last run in ms."""
+        if not self.log:
+            return "No actions run."
+        late_ms = np.array([entry["late_s"] for entry in self.log]) * 1000
+        errors = sum(entry["error"] is not None for entry in self.log)
+        return (
+            f"Actions={len(self.log)}/{len(self.actions)}, Errors={errors}, "
+            f"Lateness ms: mean={late_ms.mean():.1f}, p95={np.percentile(late_ms, 95):.1f}, max={late_ms.max():.1f}"
+        )
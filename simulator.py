@@ -0,0 +1,411 @@
+"""
+Virtual Vapourtec R2/R4 on a pseudo-terminal (Linux/macOS).
+
+VirtualR2R4 opens a pty pair and answers the R2/R4 serial protocol on the
+master side. The slave path (e.g. /dev/pts/5) can be opened with
+serial.Serial, so any interface in this repo can run against it in place of
+COM4/COM5:
+
+    with VirtualR2R4(latency=0.02, jitter=0.005) as sim:
+        r2 = R2Interface(port=sim.port)
+        r2.set_flowrate(0, 1000)
+        print(r2.get_status())
+
+Implemented commands: PN, PF, FR <pump> <rate>, KP <valve>,
+R4 ST <heater> <target> and GA. GA answers in the format
+flow.SystemStatus parses. A small physics model moves the pumps and heaters
+towards their set points and raises overpressure when the flow exceeds the
+pressure limit.
+
+Sessions with the real reactor can be recorded with TraceRecorder and played
+back with VirtualR2R4(replay=load_trace(path)).
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import tty
+from collections import defaultdict, deque
+
+# Run state flags, see flow.RunStateFlag
+OFF = 0
+RUNNING = 1
+SYSTEM_OVERPRESSURE = 2
+PUMP_A_OVERPRESSURE = 3
+PUMP_B_OVERPRESSURE = 4
+UNDERPRESSURE = 5
+PUMP_A_UNDERPRESSURE = 6
+PUMP_B_UNDERPRESSURE = 7
+
+HEATER_OFF = -1000
+AMBIENT_TEMP = 20.0
+
+#####################
+### Physics Model ###
+#####################
+
+class ReactorModel:
+    """First order pump and heater dynamics, advanced lazily on each command."""
+
+    def __init__(
+        self,
+        pressure_limit=10000,
+        pressure_per_flow=2.0,
+        pump_time_constant_s=0.5,
+        heater_time_constant_s=30.0,
+        num_heaters=4,
+    ):
+        self.pressure_limit = pressure_limit          # mbar
+        self.pressure_per_flow = pressure_per_flow    # mbar per uL/min
+        self.pump_time_constant_s = pump_time_constant_s
+        self.heater_time_constant_s = heater_time_constant_s
+
+        self.running = False
+        self.set_rates = [0.0, 0.0]                  # uL/min
+        self.rates = [0.0, 0.0]
+        self.valves = [0, 2, 4, 6, 8]
+        self.set_points = [HEATER_OFF] * num_heaters
+        self.temperatures = [AMBIENT_TEMP] * num_heaters
+        self.airlocks = [0, 0]
+
+        self.fault = None
+        self.fault_until = None
+        self._last_step = time.monotonic()
+
+    @property
+    def pressure(self):
+        return self.pressure_per_flow * sum(self.rates)
+
+    def step(self, now=None):
+        now = time.monotonic() if now is None else now
+        dt = max(0.0, now - self._last_step)
+        self._last_step = now
+
+        pump_alpha = 1 - math.exp(-dt / self.pump_time_constant_s)
+        for i, set_rate in enumerate(self.set_rates):
+            target = set_rate if self.running else 0.0
+            self.rates[i] += (target - self.rates[i]) * pump_alpha
+
+        heater_alpha = 1 - math.exp(-dt / self.heater_time_constant_s)
+        for i, set_point in enumerate(self.set_points):
+            target = set_point if self.running and set_point != HEATER_OFF else AMBIENT_TEMP
+            self.temperatures[i] += (target - self.temperatures[i]) * heater_alpha
+
+        if self.fault_until is not None and now >= self.fault_until:
+            self.fault, self.fault_until = None, None
+
+    def run_state(self):
+        if self.fault is not None:
+            return self.fault
+        if not self.running:
+            return OFF
+        if self.pressure > self.pressure_limit:
+            return SYSTEM_OVERPRESSURE
+        return RUNNING
+
+    def inject_fault(self, flag, duration_s=None):
+        """Forces a run state flag (e.g. PUMP_A_OVERPRESSURE), optionally for a limited time."""
+        self.fault = flag
+        self.fault_until = None if duration_s is None else time.monotonic() + duration_s
+
+    def clear_fault(self):
+        self.fault, self.fault_until = None, None
+
+    def status(self):
+        """GA response: run state, pump A/B rate, airlocks, pressure limit, LEDs, set points."""
+        leds = "".join("1" if valve % 2 else "0" for valve in self.valves)
+        leds += "1" if self.running else "0"
+        fields = [
+            self.run_state(),
+            round(self.rates[0]),
+            round(self.rates[1]),
+            self.airlocks[0],
+            self.airlocks[1],
+            self.pressure_limit,
+            leds,
+        ] + [int(set_point) for set_point in self.set_points]
+        return ",".join(str(field) for field in fields)
+
+#################
+### Simulator ###
+#################
+
+class VirtualR2R4:
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        timeout_rate=0.0,
+        fault_rate=0.0,
+        fault_duration_s=1.0,
+        baudrate=None,
+        model=None,
+        replay=None,
+        seed=None,
+    ):
+        """
+        latency, jitter: seconds before each response, uniform in latency +/- jitter.
+        error_rate: fraction of commands answered with "ERROR".
+        timeout_rate: fraction of commands that get no answer at all.
+        fault_rate: fraction of GA polls that start an overpressure fault
+            lasting fault_duration_s.
+        baudrate: if set, adds the wire time of each response (10 bits/byte).
+        replay: responses from load_trace(); commands seen in the trace are
+            answered with the recorded responses and latencies in order.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.fault_rate = fault_rate
+        self.fault_duration_s = fault_duration_s
+        self.baudrate = baudrate
+        self.model = model if model is not None else ReactorModel()
+        self.replay = replay
+        self.random = random.Random(seed)
+
+        self.commands_received = 0
+        self.log = deque(maxlen=10000)
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self._thread = None
+        self._running = threading.Event()
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._serve, name=f"sim-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        # Closing the fds wakes the serving thread out of os.read
+        for fd in (self._slave, self._master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _serve(self):
+        buff = bytearray()
+        while self._running.is_set():
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                break
+            if not data:
+                break
+            buff += data
+
+            start = 0
+            end = buff.find(b"\r", start)
+            while end >= 0:
+                command = buff[start:end].decode("ascii", errors="replace").strip()
+                start = end + 1
+                end = buff.find(b"\r", start)
+                if command:
+                    self._respond(command)
+            del buff[:start]
+
+    def _respond(self, command):
+        self.commands_received += 1
+        received = time.monotonic()
+
+        response, delay = self.handle(command)
+        self.log.append((received, command, response))
+        if response is None:
+            return
+
+        payload = (response + "\r\n").encode("ascii")
+        if self.baudrate:
+            delay += len(payload) * 10 / self.baudrate
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            os.write(self._master, payload)
+        except OSError:
+            pass
+
+    def handle(self, command):
+        """Returns (response, delay_s) for a command. A None response means no reply."""
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+        if self.replay is not None and self.replay.get(command):
+            recorded = self.replay[command]
+            response, recorded_delay = recorded[0]
+            recorded.rotate(-1)
+            return response, recorded_delay
+
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            return None, delay
+        if self.error_rate and self.random.random() < self.error_rate:
+            return "ERROR", delay
+
+        self.model.step()
+        try:
+            return self._execute(command.split()), delay
+        except (IndexError, ValueError):
+            return "ERROR", delay
+
+    def _execute(self, parts):
+        model = self.model
+        name = parts[0]
+
+        if name == "PN":
+            model.running = True
+        elif name == "PF":
+            model.running = False
+        elif name == "FR":
+            pump, rate = int(parts[1]), float(parts[2])
+            if pump not in (0, 1) or rate < 0:
+                return "ERROR"
+            model.set_rates[pump] = rate
+        elif name == "KP":
+            valve_id = int(parts[1])
+            if not 0 <= valve_id <= 9:
+                return "ERROR"
+            model.valves[valve_id // 2] = valve_id
+        elif name == "R4" and parts[1] == "ST":
+            heater, target = int(parts[2]), float(parts[3])
+            if not 0 <= heater < len(model.set_points):
+                return "ERROR"
+            if target != HEATER_OFF and not 20 <= target <= 250:
+                return "ERROR"
+            model.set_points[heater] = target
+        elif name == "GA":
+            if model.fault is None and self.fault_rate and self.random.random() < self.fault_rate:
+                flag = self.random.choice([SYSTEM_OVERPRESSURE, PUMP_A_OVERPRESSURE, PUMP_B_OVERPRESSURE])
+                model.inject_fault(flag, self.fault_duration_s)
+            return model.status()
+        else:
+            return "ERROR"
+        return "OK"
+
+#########################
+### Record and Replay ###
+#########################
+
+class TraceRecorder:
+    """Wraps a serial.Serial and logs every byte written and read.
+
+    Each chunk is one JSON line: {"t": seconds since start, "dir": "tx"/"rx", "data": hex}.
+
+        r2 = R2Interface("R2S")
+        r2.connection = TraceRecorder(r2.connection, "session.trace")
+    """
+
+    def __init__(self, connection, path):
+        self.connection = connection
+        self._file = open(path, "w")
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _record(self, direction, data):
+        if not data:
+            return
+        entry = {"t": time.monotonic() - self._t0, "dir": direction, "data": bytes(data).hex()}
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+
+    def write(self, data):
+        self._record("tx", data)
+        return self.connection.write(data)
+
+    def read(self, size=1):
+        data = self.connection.read(size)
+        self._record("rx", data)
+        return data
+
+    def readline(self):
+        data = self.connection.readline()
+        self._record("rx", data)
+        return data
+
+    def close(self):
+        self.connection.close()
+        self._file.close()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+def load_trace(path):
+    """Pairs the commands and responses of a recorded trace.
+
+    Returns command -> deque of (response, latency_s), in recorded order."""
+    commands = deque()
+    replay = defaultdict(deque)
+    tx, rx = bytearray(), bytearray()
+
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            data = bytes.fromhex(entry["data"])
+            if entry["dir"] == "tx":
+                tx += data
+                while b"\r" in tx:
+                    command, _, rest = bytes(tx).partition(b"\r")
+                    tx = bytearray(rest)
+                    commands.append((command.decode("ascii", errors="replace").strip(), entry["t"]))
+            else:
+                rx += data
+                while b"\n" in rx:
+                    response, _, rest = bytes(rx).partition(b"\n")
+                    rx = bytearray(rest)
+                    if not commands:
+                        continue
+                    command, sent = commands.popleft()
+                    replay[command].append((response.decode("ascii", errors="replace").strip(), entry["t"] - sent))
+    return dict(replay)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run virtual R2/R4 units on pseudo-terminals.")
+    parser.add_argument("--modules", nargs="+", default=["R2S", "R2"])
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--fault-rate", type=float, default=0.0)
+    parser.add_argument("--baudrate", type=int, default=None)
+    parser.add_argument("--replay", default=None, help="Trace recorded with TraceRecorder")
+    args = parser.parse_args()
+
+    sims = []
+    for module in args.modules:
+        sim = VirtualR2R4(
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            timeout_rate=args.timeout_rate,
+            fault_rate=args.fault_rate,
+            baudrate=args.baudrate,
+            replay=load_trace(args.replay) if args.replay else None,
+        ).start()
+        sims.append(sim)
+        print(f"{module}: {sim.port}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for sim in sims:
+            sim.stop()
@@ -0,0 +1,255 @@
+"""
+Component fits of whole IR / UV-Vis spectra.
+
+read_IR_data and read_UV_Vis_data take conversion from a single channel. Here
+every spectrum is instead fitted as a non-negative mix of reference spectra
+(monomer, polymer, THF, ...):
+
+    spectrum(t) ~ sum_k c_k(t) * reference_k
+
+All time points are solved together. The spectra only enter through one
+matrix product, spectra @ references.T (times x components). Every
+support set of the references is then solved exactly in that small space.
+The non-negative least squares (NNLS) solution is the best feasible one. So
+the cost is one pass over the spectra, however many time points there are.
+
+    fit = ComponentFit(references, names=["monomer", "polymer", "THF"])
+    conc = fit.fit(spectra)                  # (times x components)
+    conc = fit.fit(new_spectra)              # live: only the new rows
+
+With n_pcs, the spectra are first projected onto their leading principal
+components, which removes noise that none of the references explain. The
+basis comes from the channel covariance, accumulated chunk by chunk, so
+n_pcs works with chunk_size on memory-mapped spectra too.
+"""
+
+from itertools import combinations
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import nnls
+
+import ingest
+from analysis import (
+    CONC_KEY_FORMAT,
+    CONV_KEY_FORMAT,
+    TIME_KEY,
+    band_columns,
+    get_solvent_IR_data,
+    load_IR_spectra,
+)
+
+FIT_METHODS = ["nnls", "lstsq"]
+
+# Up to this many components every support set is enumerated (2^k - 1 small
+# solves per chunk); above it each spectrum is solved with scipy's nnls
+MAX_ENUMERATED_COMPONENTS = 6
+
+###########
+### PCA ###
+###########
+
+def principal_components(
+    spectra: np.ndarray, n_components: int, chunk_size: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(mean, components, explained variance ratio) of a (times x channels) matrix.
+
+    Reads chunk_size rows at a time into a (channels x channels) scatter
+    matrix, so the spectra are never converted to float64 as a whole."""
+    num_rows = len(spectra)
+    chunk_size = chunk_size or num_rows
+
+    # Rows are taken relative to the first one, so a large common offset
+    # does not cancel out the variance in the scatter matrix
+    origin = np.asarray(spectra[0], dtype=np.float64)
+    total = np.zeros_like(origin)
+    scatter = np.zeros((len(origin), len(origin)))
+    for start in range(0, num_rows, chunk_size):
+        chunk = np.asarray(spectra[start:start + chunk_size], dtype=np.float64) - origin
+        total += chunk.sum(axis=0)
+        scatter += chunk.T @ chunk
+    shift = total / num_rows
+    covariance = scatter - num_rows * np.outer(shift, shift)
+
+    variance, vectors = np.linalg.eigh(covariance)
+    variance, vectors = np.clip(variance[::-1], 0, None), vectors[:, ::-1]
+    return origin + shift, vectors[:, :n_components].T, variance[:n_components] / variance.sum()
+
+def project(spectra: np.ndarray, mean: np.ndarray, components: np.ndarray) -> np.ndarray:
+    """Spectra reconstructed from the given principal components."""
+    return mean + (np.asarray(spectra, dtype=np.float64) - mean) @ components.T @ components
+
+def denoise(spectra: np.ndarray, n_components: int) -> np.ndarray:
+    """Spectra reconstructed from their leading principal components."""
+    mean, components, _ = principal_components(spectra, n_components)
+    return project(spectra, mean, components)
+
+###########
+### Fit ###
+###########
+
+class ComponentFit:
+    """
+    Fits spectra as combinations of fixed reference spectra.
+
+    Everything that depends only on the references (Gram matrix, the
+    inverse for every support set) is computed once, so repeated fits of
+    newly arrived spectra only cost the projection onto the references.
+    """
+
+    def __init__(self, references, names: Optional[Sequence[str]] = None, method: str = "nnls"):
+        if method not in FIT_METHODS:
+            raise ValueError(f"Invalid fit method: {method}. Must be one of {FIT_METHODS}.")
+        self.references = np.atleast_2d(np.asarray(references, dtype=np.float64))
+        self.num_components = self.references.shape[0]
+        self.names = list(names) if names is not None else [str(i) for i in range(self.num_components)]
+        if len(self.names) != self.num_components:
+            raise ValueError("Need one name per reference spectrum.")
+        self.method = method
+
+        self.gram = self.references @ self.references.T
+        self._subsets = []
+        if method == "nnls" and self.num_components <= MAX_ENUMERATED_COMPONENTS:
+            for size in range(1, self.num_components + 1):
+                for subset in combinations(range(self.num_components), size):
+                    subset = np.array(subset)
+                    self._subsets.append((subset, np.linalg.pinv(self.gram[np.ix_(subset, subset)])))
+
+    def fit(self, spectra, chunk_size: Optional[int] = None, n_pcs: Optional[int] = None) -> np.ndarray:
+        """Coefficients (times x components) for a (times x channels) matrix.
+
+        chunk_size bounds the rows processed at once (e.g. for memory-mapped
+        spectra), including the PCA pass with n_pcs."""
+        spectra = np.atleast_2d(spectra)
+        if spectra.shape[1] != self.references.shape[1]:
+            raise ValueError("Spectra and references have different numbers of channels.")
+
+        chunk_size = chunk_size or len(spectra)
+        if n_pcs is not None:
+            mean, components, _ = principal_components(spectra, n_pcs, chunk_size)
+
+        coefficients = np.empty((len(spectra), self.num_components))
+        for start in range(0, len(spectra), chunk_size):
+            chunk = np.asarray(spectra[start:start + chunk_size], dtype=np.float64)
+            if n_pcs is not None:
+                chunk = project(chunk, mean, components)
+            coefficients[start:start + chunk_size] = self._fit_chunk(chunk)
+        return coefficients
+
+    def _fit_chunk(self, spectra: np.ndarray) -> np.ndarray:
+        projection = spectra @ self.references.T
+
+        if self.method == "lstsq":
+            return projection @ np.linalg.pinv(self.gram)
+        if not self._subsets:
+            return np.array([nnls(self.references.T, s)[0] for s in spectra])
+
+        # Residual of a least squares fit on a support set is |s|^2 minus the
+        # fitted part c . projection; the empty set leaves |s|^2
+        best = np.zeros((len(spectra), self.num_components))
+        best_fitted = np.zeros(len(spectra))
+        for subset, inverse in self._subsets:
+            local = projection[:, subset]
+            c = local @ inverse
+            fitted = np.einsum("ij,ij->i", c, local)
+            better = (c >= 0).all(axis=1) & (fitted > best_fitted)
+            if better.any():
+                best[better] = 0.0
+                best[np.ix_(better, subset)] = c[better]
+                best_fitted[better] = fitted[better]
+        return best
+
+    def residuals(self, spectra, coefficients) -> np.ndarray:
+        """Root mean square residual of each fitted spectrum."""
+        spectra = np.atleast_2d(np.asarray(spectra, dtype=np.float64))
+        return np.sqrt(np.mean((spectra - coefficients @ self.references) ** 2, axis=1))
+
+##################
+### Trajectory ###
+##################
+
+def concentration_frame(
+    times_min,
+    coefficients: np.ndarray,
+    names: Sequence[str],
+    monomer: Optional[str] = None,
+    shift_min: float = 7,
+) -> pd.DataFrame:
+    """TIME_KEY frame with a CONC_KEY_FORMAT column per component.
+
+    With monomer, its conversion relative to the first time point is added
+    (CONV_KEY_FORMAT). Times are shifted like the readers' plug flow delay."""
+    columns = {TIME_KEY: np.asarray(times_min, dtype=np.float64) - shift_min}
+    for name, values in zip(names, coefficients.T):
+        columns[CONC_KEY_FORMAT.format(name)] = values
+    if monomer is not None:
+        values = coefficients[:, list(names).index(monomer)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns[CONV_KEY_FORMAT.format(monomer)] = (1 - values / values[0]) * 100
+
+    data = pd.DataFrame(columns)
+    return data[data[TIME_KEY] >= 0].reset_index(drop=True)
+
+def read_IR_reference(path: str, wavenumbers: np.ndarray) -> np.ndarray:
+    """Reference spectrum from an IR CSV (wavenumber, absorbance), on the given axis."""
+    data = ingest.read_csv(path)
+    axis = data.iloc[:, 0].to_numpy(dtype=np.float64)
+    values = data.iloc[:, 1].to_numpy(dtype=np.float64)
+    order = np.argsort(axis)
+    return np.interp(np.asarray(wavenumbers, dtype=np.float64), axis[order], values[order])
+
+def fit_IR_components(
+    data_dir: str,
+    sample_name: str,
+    references: Dict[str, object],
+    window: Optional[Tuple[float, float]] = None,
+    include_solvent: bool = True,
+    monomer: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    n_pcs: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Component concentrations of an IR run.
+
+    references maps a component name to its spectrum: an array on the run's
+    wavenumber axis or the path of an IR CSV. With include_solvent, the THF
+    spectrum of the run is fitted as one more component ("THF") instead of
+    being subtracted. window restricts the fit to a wavenumber range.
+    """
+    times_min, wavenumbers, spectra = load_IR_spectra(data_dir, sample_name)
+
+    names, rows = [], []
+    for name, reference in references.items():
+        names.append(name)
+        rows.append(read_IR_reference(reference, wavenumbers) if isinstance(reference, str) else reference)
+    if include_solvent:
+        solvent = get_solvent_IR_data(f"{data_dir}/IR/THF")
+        names.append("THF")
+        rows.append(solvent.iloc[:, 1].to_numpy(dtype=np.float64))
+    rows = np.array(rows, dtype=np.float64)
+
+    if window is not None:
+        first, last = band_columns(wavenumbers, [window])
+        columns = slice(int(first[0]), int(last[0]) + 1)
+        spectra, rows = spectra[:, columns], rows[:, columns]
+
+    fit = ComponentFit(rows, names)
+    coefficients = fit.fit(spectra, chunk_size=chunk_size, n_pcs=n_pcs)
+    return concentration_frame(times_min, coefficients, names, monomer)
+
+def fit_UV_Vis_components(
+    uv_data: pd.DataFrame,
+    absorptivities: Dict[str, Sequence[float]],
+    wavelengths: Sequence[int],
+    monomer: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Component concentrations from the absorbance channels of a read_UV_Vis_data
+    frame. absorptivities maps a component to its absorbance per unit
+    concentration at each of the wavelengths. uv_data is already time shifted.
+    """
+    spectra = uv_data[[f"UV-Vis [{w} nm]" for w in wavelengths]].to_numpy(dtype=np.float64)
+    fit = ComponentFit([absorptivities[name] for name in absorptivities], list(absorptivities))
+    coefficients = fit.fit(spectra)
+    return concentration_frame(uv_data[TIME_KEY], coefficients, fit.names, monomer, shift_min=0)
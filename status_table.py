@@ -0,0 +1,184 @@
+"""
+Struct-of-arrays store for batches of GA status responses.
+
+StatusTable.from_responses parses many raw GA lines at once into typed NumPy
+columns instead of building one SystemStatus per line. Rows that fail to parse
+are kept (so rows stay aligned with their timestamps) but marked False in
+`valid`, and every filter excludes them. A line is accepted exactly when
+flow.SystemStatus accepts it: at least the 7 fields up to the LED bitmap,
+with up to four set points after it (missing ones are NaN).
+
+    table = StatusTable.from_responses(lines, times)
+    faults = table.filter(table.overpressure())
+    pump_a_during_faults = faults.pump_a_flow_rate
+"""
+
+import io
+from itertools import compress
+
+import numpy as np
+import pandas as pd
+
+from flow import OVERPRESSURE_FLAGS, UNDERPRESSURE_FLAGS, RunStateFlag
+from monitor import STATUS_COLUMNS
+
+NUM_FIELDS = 11
+MIN_FIELDS = 7
+NUM_SET_POINTS = 4
+SET_POINT_FIELD = 7
+LED_FIELD = 6
+NUMERIC_FIELDS = [0, 1, 2, 3, 4, 5, 7, 8, 9, 10]
+RUN_STATE_VALUES = [flag.value for flag in RunStateFlag]
+
+class StatusTable:
+
+    __slots__ = (
+        "time",
+        "run_state",
+        "pump_a_flow_rate",
+        "pump_b_flow_rate",
+        "airlock_numbers",
+        "pressure_limit",
+        "front_panel_leds",
+        "temperature_set_points",
+        "valid",
+    )
+
+    def __init__(
+        self,
+        time,
+        run_state,
+        pump_a_flow_rate,
+        pump_b_flow_rate,
+        airlock_numbers,
+        pressure_limit,
+        front_panel_leds,
+        temperature_set_points,
+        valid,
+    ):
+        self.time = time                                        # float64 (n,)
+        self.run_state = run_state                              # int8 (n,), -1 if invalid
+        self.pump_a_flow_rate = pump_a_flow_rate                # float64 (n,) uL/min
+        self.pump_b_flow_rate = pump_b_flow_rate                # float64 (n,) uL/min
+        self.airlock_numbers = airlock_numbers                  # int32 (n, 2)
+        self.pressure_limit = pressure_limit                    # int64 (n,) mbar
+        self.front_panel_leds = front_panel_leds                # bool (n, num_leds)
+        self.temperature_set_points = temperature_set_points    # float64 (n, 4), NaN if not reported
+        self.valid = valid                                      # bool (n,)
+
+    def __len__(self):
+        return len(self.valid)
+
+    @classmethod
+    def from_responses(cls, responses, times=None) -> "StatusTable":
+        """Parses raw GA responses (str or bytes) into a table.
+
+        times: optional timestamp per response, NaN if not given."""
+
+        lines = [
+            (r.decode("ascii", errors="replace") if isinstance(r, bytes) else r).strip()
+            for r in responses
+        ]
+        n = len(lines)
+        num_fields = np.fromiter((line.count(",") + 1 if line else 0 for line in lines), dtype=np.int64, count=n)
+        valid = num_fields >= MIN_FIELDS
+
+        # Parse every well formed line in one C level CSV pass
+        numbers = np.zeros((n, len(NUMERIC_FIELDS)))
+        led_text = np.full(n, b"", dtype="S1")
+        if valid.any():
+            text = "\n".join(compress(lines, valid))
+            # Name every field present, then keep the first NUM_FIELDS; set
+            # points missing from every line come back as NaN columns
+            names = range(int(num_fields[valid].max()))
+            frame = pd.read_csv(
+                io.StringIO(text), header=None, names=names,
+                dtype={LED_FIELD: str}, keep_default_na=False,
+            ).reindex(columns=range(NUM_FIELDS))
+            numeric = frame[NUMERIC_FIELDS].apply(pd.to_numeric, errors="coerce")
+            numbers[valid] = numeric.to_numpy(dtype=np.float64)
+            led_text = np.full(n, b"", dtype=f"S{max(1, frame[LED_FIELD].str.len().max())}")
+            led_text[valid] = frame[LED_FIELD].to_numpy(dtype=str).astype(led_text.dtype)
+
+        # Set points are optional, but the ones that are sent must parse
+        set_point_fields = SET_POINT_FIELD + np.arange(NUM_SET_POINTS)
+        reported = num_fields[:, None] > set_point_fields
+        set_points = numbers[:, -NUM_SET_POINTS:]
+        set_points[~reported] = np.nan
+        valid &= np.isfinite(numbers[:, :-NUM_SET_POINTS]).all(axis=1)
+        valid &= (np.isfinite(set_points) | ~reported).all(axis=1)
+
+        # Everything but the flow rates has to be an integer
+        integer_fields = np.delete(numbers, [1, 2], axis=1)
+        valid &= ((integer_fields == np.round(integer_fields)) | np.isnan(integer_fields)).all(axis=1)
+        valid &= np.isin(numbers[:, 0], RUN_STATE_VALUES)
+
+        # SystemStatus keeps the LED field as text; only "1" characters are lit
+        width = led_text.dtype.itemsize
+        led_bytes = np.frombuffer(led_text.tobytes(), dtype=np.uint8).reshape(n, width)
+        front_panel_leds = (led_bytes == ord("1")) & valid[:, None]
+
+        numbers[~valid] = 0
+        run_state = numbers[:, 0].astype(np.int8)
+        run_state[~valid] = -1
+
+        if times is None:
+            time = np.full(n, np.nan)
+        else:
+            time = np.asarray(times, dtype=np.float64)
+
+        return cls(
+            time=time,
+            run_state=run_state,
+            pump_a_flow_rate=numbers[:, 1],
+            pump_b_flow_rate=numbers[:, 2],
+            airlock_numbers=numbers[:, 3:5].astype(np.int32),
+            pressure_limit=numbers[:, 5].astype(np.int64),
+            front_panel_leds=front_panel_leds,
+            temperature_set_points=numbers[:, 6:6 + NUM_SET_POINTS],
+            valid=valid,
+        )
+
+    ###############
+    ### Filters ###
+    ###############
+
+    def run_state_in(self, flags):
+        """Mask of valid rows whose run state is one of flags."""
+        values = [flag.value if isinstance(flag, RunStateFlag) else flag for flag in flags]
+        return np.isin(self.run_state, values) & self.valid
+
+    def overpressure(self):
+        return self.run_state_in(OVERPRESSURE_FLAGS)
+
+    def underpressure(self):
+        return self.run_state_in(UNDERPRESSURE_FLAGS)
+
+    def between(self, start_time, end_time):
+        """Mask of valid rows with start_time <= time < end_time."""
+        return (self.time >= start_time) & (self.time < end_time) & self.valid
+
+    def filter(self, mask) -> "StatusTable":
+        return StatusTable(*(getattr(self, name)[mask] for name in self.__slots__))
+
+    def to_rows(self):
+        """Valid rows as a float64 (n, len(STATUS_COLUMNS)) array, the layout
+        used by monitor.StatusRingBuffer."""
+        v = self.valid
+        # Logged responses carry one timestamp, used for both time columns
+        return np.column_stack([
+            self.time[v],
+            self.time[v],
+            self.run_state[v],
+            self.pump_a_flow_rate[v],
+            self.pump_b_flow_rate[v],
+            self.airlock_numbers[v],
+            self.pressure_limit[v],
+            self.temperature_set_points[v],
+        ]).astype(np.float64).reshape(-1, len(STATUS_COLUMNS))
+
+    def __str__(self):
+        return (
+            f"Status Table: Rows={len(self)}, Valid={int(self.valid.sum())}, "
+            f"Overpressure={int(self.overpressure().sum())}, Underpressure={int(self.underpressure().sum())}"
+        )
@@ -0,0 +1,197 @@
+"""
+Append-only on-disk log of status samples.
+
+TelemetryWriter collects rows in the monitor.STATUS_COLUMNS layout into an
+in-memory chunk and writes each full chunk as one .npy file. Chunks are
+grouped into segment directories that rotate by age and size. Files are
+fsynced only at chunk boundaries. index.csv records the time range of every
+chunk, so TelemetryReader.query opens (memory-mapped) only the chunks that
+overlap the requested range.
+
+    writer = TelemetryWriter("telemetry")
+    monitor = SystemMonitor(r2, rate_hz=10)
+    monitor.add_listener(writer.on_sample)
+    ...
+    last_hour = TelemetryReader("telemetry").query(time.time() - 3600)
+"""
+
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from monitor import STATUS_COLUMNS, status_to_row
+
+INDEX_FILE = "index.csv"
+INDEX_FIELDS = ["path", "t_start", "t_end", "rows"]
+
+def _fsync_dir(path):
+    # Makes new file names durable; not supported on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class TelemetryWriter:
+
+    def __init__(
+        self,
+        directory: str,
+        chunk_rows: int = 6000,
+        chunk_s: float = 60.0,
+        segment_s: float = 3600.0,
+        segment_bytes: int = 256 * 1024 * 1024,
+        columns=STATUS_COLUMNS,
+    ):
+        """
+        chunk_rows, chunk_s: a chunk is written when it is full or its first
+            sample is older than chunk_s, whichever comes first.
+        segment_s, segment_bytes: a new segment directory is started when the
+            current one is older or larger than this.
+        """
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.chunk_s = chunk_s
+        self.segment_s = segment_s
+        self.segment_bytes = segment_bytes
+        self.columns = columns
+
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        if not os.path.exists(self._index_path):
+            with open(self._index_path, "w", newline="") as f:
+                csv.writer(f).writerow(INDEX_FIELDS)
+
+        self._chunk = np.empty((chunk_rows, len(columns)), dtype=np.float64)
+        self._rows = 0
+        self._chunk_count = 0
+        self._segment_dir = None
+        self._segment_started = None
+        self._segment_size = 0
+        self._lock = threading.Lock()
+
+        self.chunks_written = 0
+
+    def on_sample(self, timestamp, status):
+        """SystemMonitor listener."""
+        self.append(status_to_row(timestamp, status))
+
+    def append(self, row):
+        with self._lock:
+            self._chunk[self._rows] = row
+            self._rows += 1
+            if self._rows == self.chunk_rows or row[0] - self._chunk[0, 0] >= self.chunk_s:
+                self._write_chunk()
+
+    def flush(self):
+        """Writes the partial chunk, e.g. before shutting down."""
+        with self._lock:
+            if self._rows:
+                self._write_chunk()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pending(self):
+        """Copy of the rows not yet written to disk."""
+        with self._lock:
+            return self._chunk[:self._rows].copy()
+
+    def _segment(self, t_start):
+        if (
+            self._segment_dir is None
+            or t_start - self._segment_started >= self.segment_s
+            or self._segment_size >= self.segment_bytes
+        ):
+            name = "segment_" + datetime.fromtimestamp(t_start).strftime("%Y%m%d_%H%M%S_%f")
+            self._segment_dir = os.path.join(self.directory, name)
+            os.makedirs(self._segment_dir, exist_ok=True)
+            _fsync_dir(self.directory)
+            self._segment_started = t_start
+            self._segment_size = 0
+            self._chunk_count = 0
+        return self._segment_dir
+
+    def _write_chunk(self):
+        rows = self._chunk[:self._rows]
+        t_start, t_end = float(rows[0, 0]), float(rows[-1, 0])
+        segment_dir = self._segment(t_start)
+
+        name = f"chunk_{self._chunk_count:06d}.npy"
+        path = os.path.join(segment_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(segment_dir)
+
+        # The index entry is written last, so a crash never indexes a partial chunk
+        with open(self._index_path, "a", newline="") as f:
+            relative_path = os.path.relpath(path, self.directory)
+            csv.writer(f).writerow([relative_path, repr(t_start), repr(t_end), len(rows)])
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._segment_size += rows.nbytes
+        self._chunk_count += 1
+        self._rows = 0
+        self.chunks_written += 1
+
+class TelemetryReader:
+
+    def __init__(self, directory: str, columns=STATUS_COLUMNS):
+        self.directory = directory
+        self.columns = columns
+        self.refresh()
+
+    def refresh(self):
+        """Re-reads the index to pick up chunks written since opening."""
+        with open(os.path.join(self.directory, INDEX_FILE), newline="") as f:
+            entries = list(csv.DictReader(f))
+        self.paths = [os.path.join(self.directory, e["path"]) for e in entries]
+        self.t_start = np.array([float(e["t_start"]) for e in entries])
+        self.t_end = np.array([float(e["t_end"]) for e in entries])
+        self.rows = np.array([int(e["rows"]) for e in entries], dtype=np.int64)
+
+    def query(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> np.ndarray:
+        """Rows with start_time <= time <= end_time, oldest first."""
+        start_time = -np.inf if start_time is None else start_time
+        end_time = np.inf if end_time is None else end_time
+
+        selected = np.nonzero((self.t_end >= start_time) & (self.t_start <= end_time))[0]
+        parts = []
+        for i in selected:
+            chunk = np.load(self.paths[i], mmap_mode="r")
+            times = chunk[:, 0]
+            lo = np.searchsorted(times, start_time, side="left")
+            hi = np.searchsorted(times, end_time, side="right")
+            if hi > lo:
+                parts.append(chunk[lo:hi])
+
+        if not parts:
+            return np.empty((0, len(self.columns)))
+        if len(parts) == 1:
+            return np.asarray(parts[0])
+        return np.concatenate(parts)
+
+    def query_frame(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> pd.DataFrame:
+        return pd.DataFrame(self.query(start_time, end_time), columns=list(self.columns))
+
+    def __len__(self):
+        return int(self.rows.sum())
@@ -0,0 +1,198 @@
+"""
+Local publish/subscribe stream of status samples.
+
+TelemetryPublisher listens on a local TCP port or Unix socket. Fed by
+SystemMonitor, it pushes every sample to every connected subscriber, so
+dashboards and notebooks get live data without touching the serial port.
+Each sample is packed once and shared by all subscribers. Each subscriber
+has a bounded queue; a slow consumer loses its oldest samples rather than
+holding up the monitor.
+
+Wire format: one JSON header line {"columns": [...]}, then fixed size
+little-endian float64 records in that column order.
+
+    publisher = TelemetryPublisher().start()
+    monitor.add_listener(publisher.on_sample)
+
+    for row in TelemetrySubscriber():
+        print(row["pump_a_flow_rate"])
+"""
+
+import asyncio
+import json
+import socket
+import struct
+import threading
+from collections import deque
+
+from broker import parse_address
+from monitor import STATUS_COLUMNS, status_to_row
+
+DEFAULT_STREAM_ADDRESS = "tcp://127.0.0.1:8766"
+
+class _Subscriber:
+
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, payload):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(payload)
+        self.ready.set()
+
+class TelemetryPublisher:
+
+    def __init__(self, address=DEFAULT_STREAM_ADDRESS, queue_size=1000, columns=STATUS_COLUMNS):
+        self.address = address
+        self.queue_size = queue_size
+        self.columns = columns
+        self.record = struct.Struct("<" + "d" * len(columns))
+
+        self.published = 0
+        self.subscribers = set()
+
+        self.running = False
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+
+    def start(self):
+        """Starts serving. Raises the bind error (e.g. address in use) if it fails."""
+        self._started.clear()
+        self._error = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="telemetry-stream", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._thread = None
+            self._loop = None
+            raise self._error
+        self.running = True
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self.running = False
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def on_sample(self, timestamp, status):
+        """SystemMonitor listener."""
+        self.publish(status_to_row(timestamp, status))
+
+    def publish(self, row):
+        """Queues a row for every subscriber. Safe to call from any thread;
+        does nothing while the publisher is not running."""
+        loop = self._loop
+        if not self.running or loop is None:
+            return
+        payload = self.record.pack(*row)
+        try:
+            loop.call_soon_threadsafe(self._fan_out, payload)
+        except RuntimeError:
+            # Loop closed by a concurrent stop()
+            return
+        self.published += 1
+
+    def _fan_out(self, payload):
+        for subscriber in self.subscribers:
+            subscriber.push(payload)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except BaseException as e:
+            self._error = e
+            self._loop.close()
+            return
+        finally:
+            self._started.set()
+        self._loop.run_forever()
+
+    async def _serve(self):
+        family, target = parse_address(self.address)
+        if family == "unix":
+            self._server = await asyncio.start_unix_server(self._handle, path=target)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=target[0], port=target[1])
+
+    async def _close(self):
+        self._server.close()
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        subscriber = _Subscriber(writer, self.queue_size)
+        header = json.dumps({"columns": list(self.columns)}) + "\n"
+        writer.write(header.encode("ascii"))
+        self.subscribers.add(subscriber)
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.queue:
+                    writer.write(subscriber.queue.popleft())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            writer.close()
+
+class TelemetrySubscriber:
+    """Blocking iterator over the samples of a TelemetryPublisher.
+
+    Yields dicts of column name -> value."""
+
+    def __init__(self, address=DEFAULT_STREAM_ADDRESS, timeout=None):
+        family, target = parse_address(address)
+        if family == "unix":
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(target)
+
+        self._file = self.socket.makefile("rb")
+        header = json.loads(self._file.readline())
+        self.columns = header["columns"]
+        self.record = struct.Struct("<" + "d" * len(self.columns))
+
+    def read(self):
+        """Next sample as a tuple in column order, or None once the stream ends."""
+        data = self._file.read(self.record.size)
+        if len(data) < self.record.size:
+            return None
+        return self.record.unpack(data)
+
+    def __iter__(self):
+        while True:
+            row = self.read()
+            if row is None:
+                return
+            yield dict(zip(self.columns, row))
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
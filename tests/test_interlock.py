@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import flow
+from flow import InterlockError, R2Interface
+from interlock import Interlock
+
+class FakeConnection:
+    """Answers every command with OK and records what reached the port."""
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def readline(self):
+        return b"OK\r\n"
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.001)
+
+@pytest.fixture
+def r2(monkeypatch):
+    monkeypatch.setattr(flow, "open_serial", lambda port: FakeConnection())
+    return R2Interface(port="fake")
+
+def test_command_waiting_on_the_line_does_not_follow_a_trip(r2):
+    interlock = Interlock(r2, rules=[], actions=["PF"])
+    errors = []
+
+    def start():
+        try:
+            r2.start()
+        except InterlockError as e:
+            errors.append(e)
+
+    # Hold the line so PN queues behind it after passing the lockout check in _send
+    r2._lock.acquire()
+    try:
+        waiting = threading.Thread(target=start, daemon=True)
+        waiting.start()
+        wait_for(lambda: r2._lock._next_ticket == 2)
+
+        tripping = threading.Thread(target=interlock.trip, args=("test",), daemon=True)
+        tripping.start()
+        wait_for(lambda: r2._lock._urgent_waiting == 1)
+    finally:
+        r2._lock.release()
+
+    tripping.join(2)
+    waiting.join(2)
+    assert r2.connection.written == [b"PF\r"]
+    assert len(errors) == 1
+    assert interlock.safe
+
+def test_status_polling_continues_after_a_trip(r2):
+    Interlock(r2, rules=[], actions=["PF"]).trip("test")
+    r2._send("GA")
+    with pytest.raises(InterlockError):
+        r2.set_flowrate(0, 1.0)
+    assert r2.connection.written == [b"PF\r", b"GA\r"]
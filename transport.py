@@ -1,46 +1,148 @@
 """
 Class for creating objects to communicate over a serial connection.
 Messages are sent with a terminating sequence, and then the response
-is read until the terminating sequence is recieved."""
+is read until the terminating sequence is recieved.
 
-import serial
+By default a background FrameReader does bulk reads of whatever the port
+has buffered and splits the stream into frames on the terminator, so a
+response costs one queue hand-off instead of one read() call per byte.
+Pass framed=False to use the original byte-at-a-time read for comparison."""
+
+import queue
+import threading
+
+import serial as pyserial
+
+class FrameReader(threading.Thread):
+    """Reads a serial connection in bulk and splits it into terminated frames.
+
+    Incoming bytes are appended to one reusable bytearray. Complete frames are
+    sliced out in a single pass per read and put on the frames queue; the
+    consumed prefix is then dropped in one go."""
+
+    def __init__(self, connection, terminator):
+        super().__init__(name=f"frame-reader-{connection.port}", daemon=True)
+        self.connection = connection
+        self.terminator = terminator
+        self.frames = queue.Queue()
+
+        self.bytes_read = 0
+        self.frames_read = 0
+
+        self._buffer = bytearray()
+        self._running = threading.Event()
+
+    def start(self):
+        self._running.set()
+        super().start()
+
+    def stop(self):
+        self._running.clear()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while self._running.is_set():
+            try:
+                data = self.connection.read(max(1, self.connection.in_waiting))
+            except (pyserial.SerialException, OSError, TypeError):
+                # Port closed underneath us
+                break
+            if data:
+                self.bytes_read += len(data)
+                self.feed(data)
+
+    def feed(self, data):
+        """Adds raw bytes to the buffer and queues every complete frame."""
+        buff = self._buffer
+        # Only rescan the tail that could hold a terminator split across reads
+        search_from = max(0, len(buff) - len(self.terminator) + 1)
+        buff += data
+
+        start = 0
+        end = buff.find(self.terminator, search_from)
+        while end >= 0:
+            self.frames.put(bytes(buff[start:end]))
+            self.frames_read += 1
+            start = end + len(self.terminator)
+            end = buff.find(self.terminator, start)
+        if start:
+            del buff[:start]
+
+    def clear(self):
+        """Discards frames nobody waited for (e.g. late answers to timed out commands)."""
+        try:
+            while True:
+                self.frames.get_nowait()
+        except queue.Empty:
+            pass
 
 class serial (object):
     ser = None
     _terminator = None
     _terminator_len = 0
-    
-    def __init__ (self, port):
-        
-        # self.ser = serial.Serial()
-        # self.ser.port = port
-        # self.ser.baudrate = 19200
-        # self.ser.timeout = 1
-        
-        
-        self.connection = serial.Serial(
+
+    def __init__ (self, port, framed=True, timeout=2):
+
+        self.framed = framed
+        self.timeout = timeout
+        self.reader = None
+
+        self.connection = pyserial.Serial(
             port = port,
             baudrate = 19200,
-            bytesize = serial.EIGHTBITS,
-            parity = serial.PARITY_NONE,
+            bytesize = pyserial.EIGHTBITS,
+            parity = pyserial.PARITY_NONE,
             stopbits = 1,
             xonxoff = 1,
-            timeout = 2
+            # The frame reader only needs a short read timeout so it can stop;
+            # the response timeout is applied when waiting on its queue.
+            timeout = 0.1 if framed else timeout
         )
-        
+
     def setTerminator(self, terminator):
+        if isinstance(terminator, str):
+            terminator = terminator.encode('ascii')
         self._terminator = terminator
         self._terminator_len = len(terminator)
-        
+
     def open(self):
-        self.connection.open()
-        
+        if not self.connection.is_open:
+            self.connection.open()
+        if self.framed and self.reader is None:
+            self.reader = FrameReader(self.connection, self._terminator)
+            self.reader.start()
+
     def close(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
         self.connection.close()
-        
+
     def send(self, line):
-        buff = ""
-        self.socket.send(line + self._terminator)
+        """Sends a line and returns the response without its terminator.
+        Returns an empty string if no response arrives before the timeout."""
+        if self.framed:
+            return self._send_framed(line)
+        return self._send_unframed(line)
+
+    def _send_framed(self, line):
+        self.reader.clear()
+        self.connection.write(line.encode('ascii') + self._terminator)
+        try:
+            frame = self.reader.frames.get(timeout=self.timeout)
+        except queue.Empty:
+            return ""
+        return frame.decode('ascii', errors='replace')
+
+    def _send_unframed(self, line):
+        buff = b""
+        self.connection.write(line.encode('ascii') + self._terminator)
         while len(buff) < self._terminator_len or buff[-self._terminator_len:] != self._terminator:
-            buff = buff + self.connection.read()
-            return buff[:-self._terminator_len]
+            byte = self.connection.read()
+            if not byte:
+                break
+            buff = buff + byte
+        if buff.endswith(self._terminator):
+            buff = buff[:-self._terminator_len]
+        return buff.decode('ascii', errors='replace')